@@ -30,6 +30,7 @@
 # The code here was written by Simon Parsons, based on examples from
 # the PacMan AI projects.
 
+from collections import namedtuple
 from random import random
 from pacman import Directions
 import util
@@ -61,13 +62,43 @@ directionProb = 0.8
 # 
 # Sensing
 #
+
+# Everything Pacman senses of a state, as returned by snapshot(). Each
+# field holds what the sensing function of the same name returns, as
+# a tuple.
+Snapshot = namedtuple('Snapshot', [
+    'whereAmI', 'legalActions', 'ghosts', 'ghostStates',
+    'ghostStatesWithTimes', 'capsules', 'food',
+])
+
+def snapshot(state):
+    # Returns the Snapshot of state.
+    #
+    # Everything is sensed in one pass the first time this is called,
+    # and the snapshot is kept on the state object, so sensing the same
+    # state again costs nothing. The functions below are views of it.
+
+    if not hasattr(state, 'apiSnapshot'):
+        ghostStateInfo = state.getGhostStates()
+        ghostPositions = [s.getPosition() for s in ghostStateInfo]
+        state.apiSnapshot = Snapshot(
+            state.getPacmanPosition(),
+            tuple(state.getLegalPacmanActions()),
+            tuple(union(visible(ghostPositions, state), audible(ghostPositions, state))),
+            tuple([(s.getPosition(), int(s.scaredTimer > 0)) for s in ghostStateInfo]),
+            tuple([(s.getPosition(), s.scaredTimer) for s in ghostStateInfo]),
+            tuple(visible(state.getCapsules(), state)),
+            tuple(visible(state.getFoodList(), state)),
+        )
+    return state.apiSnapshot
+
 def whereAmI(state):
     # Returns an (x, y) pair of Pacman's position.
     #
     # This version says exactly where Pacman is.
     # In later version this may be obfusticated.
 
-    return state.getPacmanPosition()
+    return snapshot(state).whereAmI
 
 def legalActions(state):
     # Returns the legal set of actions
@@ -75,7 +106,7 @@ def legalActions(state):
     # Just pulls this data out of the state. Function included so that
     # all interactions are through this API.
     
-    return state.getLegalPacmanActions()
+    return list(snapshot(state).legalActions)
 
 def ghosts(state):
     # Returns a list of (x, y) pairs of ghost positions.
@@ -84,7 +115,7 @@ def ghosts(state):
     # In later versions this will be more restricted, and include some
     # uncertainty.
             
-    return union(visible(state.getGhostPositions(),state), audible(state.getGhostPositions(),state))
+    return list(snapshot(state).ghosts)
 
 def ghostStates(state):
     # Returns the position of the ghsosts, plus an indication of
@@ -97,25 +128,14 @@ def ghostStates(state):
     # where "state" is 1 if the relevant ghost is scared/edible, and 0
     # otherwise.
     
-    ghostStateInfo = state.getGhostStates()
-    ghostStates = []
-    for s in ghostStateInfo:
-        if s.scaredTimer > 0:
-            ghostStates.append((s.getPosition(), 1))
-        else:
-            ghostStates.append((s.getPosition(), 0))
-    return ghostStates
+    return list(snapshot(state).ghostStates)
 
 def ghostStatesWithTimes(state):
     # Just as ghostStates(), but when the ghost is in scared/edible
     # mode, "state" is a time value (how much longer the ghost will
     # remain scared/edible) rather than 1.
     
-    ghostStateInfo = state.getGhostStates()
-    ghostStates = []
-    for s in ghostStateInfo:
-        ghostStates.append((s.getPosition(), s.scaredTimer))
-    return ghostStates
+    return list(snapshot(state).ghostStatesWithTimes)
 
 def capsules(state):
     # Returns a list of (x, y) pairs of capsule positions.
@@ -133,7 +153,7 @@ def capsules(state):
     #
     # In both cases, walls block the view.
     
-    return visible(state.getCapsules(), state)
+    return list(snapshot(state).capsules)
 
 def food(state):
     # Returns a list of (x, y) pairs of food positions
@@ -151,49 +171,28 @@ def food(state):
     #
     # In both cases, walls block the view.
     
-    foodList= []
-    foodGrid = state.getFood()
-    width = foodGrid.width
-    height = foodGrid.height
-    for i in range(width):
-        for j in range(height):
-            if foodGrid[i][j] == True:
-                foodList.append((i, j))
-            
-    # Return list of food that is visible
-    return visible(foodList, state)
+    return list(snapshot(state).food)
 
 def walls(state):
-    # Returns a list of (x, y) pairs of wall positions
+    # Returns a frozenset of (x, y) pairs of wall positions
     #
     # This version just returns all the current wall locations
     # extracted from the state data.  In later versions, this will be
     # restricted by distance, and include some uncertainty.
+    #
+    # Walls never change, so the set is worked out once per layout and
+    # the same set is returned every time. It is a frozenset of (x,y)
+    # positions, which tests membership in constant time; there is no
+    # packed bitmask of the walls.
     
-    wallList= []
-    wallGrid = state.getWalls()
-    width = wallGrid.width
-    height = wallGrid.height
-    for i in range(width):
-        for j in range(height):
-            if wallGrid[i][j] == True:
-                wallList.append((i, j))            
-    return wallList
+    return state.getWallData().walls
 
 def corners(state):
     # Returns the coordinates of the four corners of the state space.
     #
     # For harder exploration we could obfusticate this information.
 
-    corners=[]
-    wallGrid = state.getWalls()
-    width = wallGrid.width
-    height = wallGrid.height
-    corners.append((0, 0))
-    corners.append((width-1, 0))
-    corners.append((0, height-1))
-    corners.append((width-1, height-1))
-    return corners
+    return list(state.getWallData().corners)
                 
 #
 # Acting
@@ -257,63 +256,48 @@ def distanceLimited(objects, state, limit):
 
     return nearObjects
 
+# Line of sight index, computed once per layout and keyed by the
+# layout's set of walls. For each open cell it maps each compass
+# direction to the set of cells along it before a wall gets in the way.
+sightLines = {}
+
+# The step Pacman looks along in each compass direction
+sightSteps = {
+    Directions.NORTH: (0, 1),
+    Directions.SOUTH: (0, -1),
+    Directions.EAST: (1, 0),
+    Directions.WEST: (-1, 0),
+}
+
+def lineOfSight(state):
+    # Returns the line of sight index of the layout of state, building
+    # it on first use.
+    #
+    # Every copy of a layout shares its set of walls, which remembers
+    # its hash, so finding the index is a constant time lookup.
+
+    wallData = state.getWallData()
+    if wallData.walls not in sightLines:
+        sight = {}
+        for x, y in wallData.openCells:
+            sight[(x, y)] = {}
+            for facing, (dx, dy) in sightSteps.items():
+                cells = []
+                next = (x + dx, y + dy)
+                while next in wallData.openCells:
+                    cells.append(next)
+                    next = (next[0] + dx, next[1] + dy)
+                sight[(x, y)][facing] = frozenset(cells)
+        sightLines[wallData.walls] = sight
+    return sightLines[wallData.walls]
+
 def inFront(object, facing, state):
     # Returns true if the object is along the corridor in the
     # direction of the parameter "facing" before a wall gets in the
     # way.
-    
-    pacman = state.getPacmanPosition()
-    pacman_x = pacman[0]
-    pacman_y = pacman[1]
-    wallList = walls(state)
-
-    # If Pacman is facing North
-    if facing == Directions.NORTH:
-        # Check if the object is anywhere due North of Pacman before a
-        # wall intervenes.
-        next = (pacman_x, pacman_y + 1)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (pacman_x, next[1] + 1)
-        return False
-
-    # If Pacman is facing South
-    if facing == Directions.SOUTH:
-        # Check if the object is anywhere due North of Pacman before a
-        # wall intervenes.
-        next = (pacman_x, pacman_y - 1)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (pacman_x, next[1] - 1)
-        return False
 
-    # If Pacman is facing East
-    if facing == Directions.EAST:
-        # Check if the object is anywhere due East of Pacman before a
-        # wall intervenes.
-        next = (pacman_x + 1, pacman_y)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (next[0] + 1, pacman_y)
-        return False
-    
-    # If Pacman is facing West
-    if facing == Directions.WEST:
-        # Check if the object is anywhere due West of Pacman before a
-        # wall intervenes.
-        next = (pacman_x - 1, pacman_y)
-        while not next in wallList:
-            if next == object:
-                return True
-            else:
-                next = (next[0] - 1, pacman_y)
-        return False
+    sight = lineOfSight(state)[state.getPacmanPosition()]
+    return facing in sight and object in sight[facing]
 
 def atSide(object, facing, state):
     # Returns true if the object is in a side corridor perpendicular
@@ -351,27 +335,31 @@ def visible(objects, state):
     # When passed a list of objects, returns those that are visible to
     # Pacman.
 
+    # If we return objects, then we have full observability, and there
+    # is no need to work out which of them Pacman can see.
+    if not partialVisibility:
+        return objects
+
     # This code creates partial observability by only returning some
     # of the members of objects.
     facing = state.getPacmanState().configuration.direction
-    visibleObjects = []
-    sideObjects = []
+    sight = lineOfSight(state)[state.getPacmanPosition()]
     
     if facing != Directions.STOP:
     
         # If Pacman is moving, visible objects are those in front of,
         # and to the side (if there are any side corridors).
+        if facing == Directions.NORTH or facing == Directions.SOUTH:
+            side = sight[Directions.WEST] | sight[Directions.EAST]
+        else:
+            side = sight[Directions.NORTH] | sight[Directions.SOUTH]
 
         # Objects in front. Visible up to "visibilityLimit"
-        for i in range(len(objects)):
-            if inFront(objects[i], facing, state):
-                visibleObjects.append(objects[i])
+        visibleObjects = [o for o in objects if o in sight[facing]]
         visibleObjects = distanceLimited(visibleObjects, state, visibilityLimit)
         
         # Objects to the side. Visible up to "sideLimit"
-        for i in range(len(objects)):
-            if atSide(objects[i], facing, state):
-                sideObjects.append(objects[i])
+        sideObjects = [o for o in objects if o in side]
         sideObjects = distanceLimited(sideObjects, state, sideLimit)
 
         # Combine lists.
@@ -384,24 +372,11 @@ def visible(objects, state):
         # Unfortunately facing will never have value Directions.STOP
         # after the first move is made, so this code will not run
         # after the first move :-(
-
-        for i in range(len(objects)):
-            if inFront(objects[i], Directions.NORTH, state):
-                visibleObjects.append(objects[i])
-            if inFront(objects[i], Directions.SOUTH, state):
-                visibleObjects.append(objects[i])
-            if inFront(objects[i], Directions.EAST, state):
-                visibleObjects.append(objects[i])
-            if inFront(objects[i], Directions.WEST, state):
-                visibleObjects.append(objects[i])
+        around = frozenset().union(*sight.values())
+        visibleObjects = [o for o in objects if o in around]
         visibleObjects = distanceLimited(visibleObjects, state, visibilityLimit)
 
-    # If we return visibleObjects, we have partial observability. If
-    # we return objects, then we have full observability.
-    if partialVisibility:
-        return visibleObjects
-    else:
-        return objects
+    return visibleObjects
 
 def audible(ghosts, state):
     # A ghost is audible if it is any direction and less than
@@ -22,6 +22,7 @@
 
 from util import *
 import time, os
+import copy
 import traceback
 import sys
 
@@ -375,11 +376,33 @@ class GameStateData:
     def __init__( self, prevState = None ):
         """
         Generates a new data packet by copying information from its predecessor.
+
+        The food grid, the capsule list and the agent states are shared with
+        the predecessor, and copied only when they are first changed: by
+        eatFood, eatCapsule and the writable accessors. The layout never
+        changes, so it is shared too, unless an agent asks for the walls.
         """
+        # Positions of the remaining food, built on first use by foodList
+        self._foodList = None
+        # False once the food grid has been handed out to be changed, so
+        # foodList can no longer keep up with it
+        self._foodTracked = True
+        # The shared parts this packet has its own copies of: agent indices,
+        # 'food', 'capsules' and 'layout'
+        self._writable = set()
+        # True in the copies given to agents and their successors, whose
+        # accessors hand out this packet's own copies of the shared parts
+        self.isolated = False
         if prevState != None:
-            self.food = prevState.food.shallowCopy()
-            self.capsules = prevState.capsules[:]
-            self.agentStates = self.copyAgentStates( prevState.agentStates )
+            self.food = prevState.food
+            # Immutable, so shared until food is eaten
+            self._foodList = prevState._foodList
+            self._foodTracked = prevState._foodTracked
+            self.capsules = prevState.capsules
+            self.agentStates = prevState.agentStates[:]
+            # Now shared, so the predecessor must copy them to change them too
+            prevState._writable.clear()
+            self.isolated = prevState.isolated
             self.layout = prevState.layout
             self._eaten = prevState._eaten
             self.score = prevState.score
@@ -393,20 +416,103 @@ class GameStateData:
         self.scoreChange = 0
 
     def deepCopy( self ):
+        """
+        Returns a copy for an agent to observe. It shares everything with
+        this packet, but is isolated: its accessors copy the food, capsules,
+        agent states and walls before handing them out, so nothing the agent
+        does to them reaches this packet.
+        """
         state = GameStateData( self )
-        state.food = self.food.deepCopy()
-        state.layout = self.layout.deepCopy()
+        state.isolated = True
         state._agentMoved = self._agentMoved
         state._foodEaten = self._foodEaten
         state._foodAdded = self._foodAdded
         state._capsuleEaten = self._capsuleEaten
         return state
 
-    def copyAgentStates( self, agentStates ):
-        copiedStates = []
-        for agentState in agentStates:
-            copiedStates.append( agentState.copy() )
-        return copiedStates
+    def foodList( self ):
+        """
+        Returns a tuple of the positions of the remaining food, in the order
+        food.asList() gives them. It is built from the grid once per game,
+        then kept up to date by eatFood and shared by successor states.
+        """
+        if not self._foodTracked:
+            # The grid may have been changed behind our back
+            return tuple( self.food.asList() )
+        if self._foodList == None:
+            self._foodList = tuple( self.food.asList() )
+        return self._foodList
+
+    def _ownFood( self ):
+        if 'food' not in self._writable:
+            self.food = self.food.copy()
+            self._writable.add( 'food' )
+            if not self._foodTracked:
+                # The copy is only changed through eatFood until handed out
+                self._foodList = None
+                self._foodTracked = True
+        return self.food
+
+    def eatFood( self, position ):
+        """
+        Removes the food at position, recording it in _foodEaten.
+        """
+        x, y = position
+        self._ownFood()[x][y] = False
+        self._foodEaten = position
+        if self._foodList != None:
+            self._foodList = tuple( [p for p in self._foodList if p != position] )
+
+    def eatCapsule( self, position ):
+        """
+        Removes the capsule at position, recording it in _capsuleEaten.
+        """
+        self.writableCapsules().remove( position )
+        self._capsuleEaten = position
+
+    def writableFood( self ):
+        """
+        Returns the food grid, ready to be changed. The first call replaces
+        the shared grid with this packet's own copy. Changes made to it can't
+        be tracked, so foodList reads the grid from then on.
+        """
+        food = self._ownFood()
+        self._foodTracked = False
+        return food
+
+    def writableCapsules( self ):
+        """
+        Returns the capsule list, ready to be changed. The first call replaces
+        the shared list with this packet's own copy.
+        """
+        if 'capsules' not in self._writable:
+            self.capsules = self.capsules[:]
+            self._writable.add( 'capsules' )
+        return self.capsules
+
+    def writableAgentState( self, index ):
+        """
+        Returns the state of agent index, ready to be changed. Agent states
+        are shared with the packets this one was copied from, so the first
+        call for an agent replaces its state with this packet's own copy.
+        """
+        if index not in self._writable:
+            self.agentStates[index] = self.agentStates[index].copy()
+            self._writable.add( index )
+        return self.agentStates[index]
+
+    def writableLayout( self ):
+        """
+        Returns the layout with walls ready to be changed. The first call
+        replaces the shared layout with a copy that has its own walls.
+        """
+        if 'layout' not in self._writable:
+            self.layout = copy.copy( self.layout )
+            self.layout.walls = self.layout.walls.copy()
+            # Built again from these walls, should it be asked for
+            self.layout.wallData = None
+            self._writable.add( 'layout' )
+        return self.layout
 
     def __eq__( self, other ):
         """
@@ -489,6 +595,7 @@ class GameStateData:
         Creates an initial game state from a layout array (see layout.py).
         """
         self.food = layout.food.copy()
+        self._foodList = None
         #self.capsules = []
         self.capsules = layout.capsules[:]
         self.layout = layout
@@ -584,6 +691,9 @@ class Game:
                 self.unmute()
                 self._agentCrash(i, quiet=True)
                 return
+            # tell anytime agents how long they may spend on each move
+            if ("setMoveBudget" in dir(agent)):
+                agent.setMoveBudget(self.rules.getMoveWarningTime(i))
             if ("registerInitialState" in dir(agent)):
                 self.mute(i)
                 if self.catchExceptions:
@@ -728,3 +838,35 @@ class Game:
                     self.unmute()
                     return
         self.display.finish()
+
+    def start( self ):
+        """
+        Starts the game without playing it, for runners that step several
+        games side by side with play() and finish(). Agent exceptions are not
+        caught.
+        """
+        self.display.initialize(self.state.data)
+        self.numMoves = 0
+        for i, agent in enumerate(self.agents):
+            if ("setMoveBudget" in dir(agent)):
+                agent.setMoveBudget(self.rules.getMoveWarningTime(i))
+            if ("registerInitialState" in dir(agent)):
+                agent.registerInitialState(self.state.deepCopy())
+
+    def play( self, agentIndex, action ):
+        """
+        Executes the action an agent chose, as one turn of run() does.
+        """
+        self.moveHistory.append( (agentIndex, action) )
+        self.state = self.state.generateSuccessor( agentIndex, action )
+        self.display.update( self.state.data )
+        self.rules.process(self.state, self)
+
+    def finish( self ):
+        """
+        Informs the agents of the game result, as run() does once it is over.
+        """
+        for agent in self.agents:
+            if "final" in dir( agent ):
+                agent.final( self.state )
+        self.display.finish()
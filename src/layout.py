@@ -14,11 +14,15 @@
 
 from util import manhattanDistance
 from game import Grid
+from collections import namedtuple
 import os
 import random
 
 VISIBILITY_MATRIX_CACHE = {}
 
+# The fixed geometry of a layout, as returned by Layout.getWallData
+WallData = namedtuple('WallData', ['walls', 'openCells', 'corners'])
+
 class Layout:
     """
     A Layout manages the static information about the game board.
@@ -35,6 +39,7 @@ class Layout:
         self.processLayoutText(layoutText)
         self.layoutText = layoutText
         self.totalFood = len(self.food.asList())
+        self.wallData = None
         # self.initializeVisibilityMatrix()
 
     def getNumGhosts(self):
@@ -89,8 +94,30 @@ class Layout:
     def __str__(self):
         return "\n".join(self.layoutText)
 
+    def getWallData(self):
+        """
+        Returns the WallData of the layout: the walls and the open cells as
+        frozensets of (x,y) positions, and the four corners. It is built on
+        first use and shared by every copy of the layout, as the walls never
+        change.
+
+        There is deliberately no packed bitmask of the walls: every caller
+        only tests membership, which the frozensets already do in constant
+        time, and building the bitmask cost O(W*H) big-integer work.
+        """
+        if self.wallData == None:
+            self.wallData = WallData(
+                frozenset(self.walls.asList()),
+                frozenset(self.walls.asList(False)),
+                ((0, 0), (self.width - 1, 0), (0, self.height - 1), (self.width - 1, self.height - 1)),
+            )
+        return self.wallData
+
     def deepCopy(self):
-        return Layout(self.layoutText[:])
+        layout = Layout(self.layoutText[:])
+        # Built here, so the original and all its copies share one
+        layout.wallData = self.getWallData()
+        return layout
 
     def processLayoutText(self, layoutText):
         """
@@ -1,13 +1,24 @@
-from copy import deepcopy
-from collections import defaultdict
-from math import exp, sqrt, ceil
+from array import array
+from collections import defaultdict, OrderedDict
+from hashlib import md5
+import json
+from math import e, exp, log, sqrt, ceil, floor
+from multiprocessing import Array, Pipe, Pool, Process, cpu_count
 from re import sub
+import shelve
+from threading import Lock
+from time import time
 
 from pacman import Directions
 from game import Agent, Actions
 import api
 import util
 
+try:
+    import numpy
+except ImportError:  # only needed by the 'numpy' solver
+    numpy = None
+
 
 ################## Fixing camel casing to comply with PEP8 ####################
 def snake_to_camel(term):
@@ -77,6 +88,40 @@ snake_case(api)
 ###############################################################################
 
 
+def flag(value):
+    '''
+    Interprets an agent arg as a boolean. Bare agent args (e.g. '-a report')
+    arrive as 1, while '-a report=False' arrives as the string 'False'.
+
+    Args:
+        value: Value of the agent arg.
+
+    Returns:
+        Bool that is true if value spells out a true value.
+    '''
+    return str(value).lower() in {'1', 'true', 'yes', 'on'}
+
+
+def choice(value, options, name):
+    '''
+    Checks that an agent arg is one of a fixed set of options.
+
+    Args:
+        value (str): Value of the agent arg.
+        options (tuple): Allowed values.
+        name (str): Name of the agent arg, used in the error message.
+
+    Returns:
+        value, if it is one of options.
+    '''
+    if value not in options:
+        raise ValueError(
+            'Unknown %s %r, expected one of: %s' %
+            (name, value, ', '.join(options))
+        )
+    return value
+
+
 class Coordinate(tuple):
     '''
     Tuple wrapper ensuring: size is 2, x & y are ints and enabling easy 
@@ -93,6 +138,21 @@ class Coordinate(tuple):
     def __deepcopy__(self, memo):
         return Coordinate(x=self[0], y=self[1])
 
+    @staticmethod
+    def around(position):
+        '''
+        Args:
+            position (tuple): (x, y) position, possibly mid-move floats.
+
+        Returns:
+            Set of the coordinates position lies on or between.
+        '''
+        x, y = position
+        return {
+            Coordinate(i, j)
+            for i in (floor(x), ceil(x)) for j in (floor(y), ceil(y))
+        }
+
 
 class Dispositions(object):
     '''
@@ -108,18 +168,22 @@ class Dispositions(object):
 
 class Point(object):
     '''
-    A single point on the board.
+    A single point on the board. Points are views onto one cell of the
+    columns of a Grid, so they hold nothing but the grid and the cell's id,
+    and are created on demand.
 
     Attributes:
         disposition (Dispositions): Current disposition, discribing the state 
         of the point.
-        reward (float): Current reward value of this point dependent on current 
-        disposition.
+        reward (float): Reward value of this point for the current turn,
+        dependent on its disposition.
         utility (float): Current utility value of this point.
-        min_ghost_distance (int): Minimum manhattan distance from point to a 
+        min_ghost_distance (float): Minimum manhattan distance from point to a
         ghost.
     '''
 
+    __slots__ = ('__grid', '__id')
+
     # Reward value for each state
     REWARDS = {
         # Negative rewards
@@ -132,60 +196,40 @@ class Point(object):
         Dispositions.FOOD: 2,
     }
 
-    def __init__(
-        self,
-        utility=None,
-        disposition=Dispositions.EMPTY,
-        min_ghost_distance=None,
-    ):
+    def __init__(self, grid, id):
         '''
         Args:
-            utility (int): Initial utility.
-            disposition (Dispositions): Initial disposition.
-            min_ghost_distance (int): Manhattan distance to closest ghost
+            grid (Grid): Grid the point belongs to.
+            id (int): Cell id of the point in grid.
         '''
-        self.__utility = utility
-        self.__disposition = disposition
-        self.__min_ghost_distance = min_ghost_distance
-
-    def __copy__(self):
-        return Point(
-            utility=self.__utility,
-            disposition=self.__disposition,
-            min_ghost_distance=self.__min_ghost_distance,
-        )
+        self.__grid = grid
+        self.__id = id
 
     @property
     def min_ghost_distance(self):
         '''
         Returns:
-            Integer representing manhattan distance to closest ghost, or max 
-            grid distance if not set.
+            Number representing manhattan distance to closest ghost, or max
+            grid distance if no ghost is closer.
         '''
-        if self.__min_ghost_distance is None:
-            return Grid.MAX_DISTANCE
-        else:
-            return self.__min_ghost_distance
+        return self.__grid.ghost_distances[self.__id]
 
     @min_ghost_distance.setter
     def min_ghost_distance(self, value):
-        self.__min_ghost_distance = value
+        self.__grid.ghost_distances[self.__id] = value
 
     @property
     def utility(self):
         '''
         Returns:
-            Floating point number representing the points current utility if
-            set, otherwise returns the default reward.
+            Floating point number representing the points current utility,
+            which starts each turn at its reward.
         '''
-        if self.__utility is None:
-            return self.reward
-        else:
-            return self.__utility
+        return self.__grid.utilities[self.__id]
 
     @utility.setter
     def utility(self, value):
-        self.__utility = value
+        self.__grid.utilities[self.__id] = value
 
     @property
     def disposition(self):
@@ -196,21 +240,21 @@ class Point(object):
             from any ghost, the state  is overridden with 
             Dispositions.GHOST_NEIGHBOUR.
         '''
-        if self.__disposition != Dispositions.GHOST_HOSTILE and \
-                self.min_ghost_distance <= Grid.GHOST_RADIUS:
-            return Dispositions.GHOST_NEIGHBOUR
-
-        return self.__disposition
+        return Grid.disposition(
+            self.__grid.dispositions[self.__id],
+            self.min_ghost_distance,
+            self.__grid.context.ghost_radius,
+        )
 
     @disposition.setter
     def disposition(self, value):
-        self.__disposition = value
+        self.__grid.dispositions[self.__id] = Grid.CODES[value]
 
     @property
     def reward(self):
         '''
-        Calculates and returns the shaped reward depending on the current
-        state.
+        The shaped reward of the point for the current turn, evaluated by
+        Grid once per turn.
 
             Dynamic Reward - Positive
             R(s) = r(s) * f_phi / f_delta
@@ -224,100 +268,277 @@ class Point(object):
         Returns:
             Float representing the points current reward value.
         '''
-        if self.disposition in {Dispositions.FOOD, Dispositions.CAPSULE}:
-            return Point.REWARDS[self.disposition] * self.__f_phi() / \
-                self.__f_delta()
-
-        return Point.REWARDS[self.disposition] * self.__f_delta()
+        return self.__grid.rewards[self.__id]
 
-    def __f_delta(self):
+    @staticmethod
+    def shaped_reward(disposition, f_delta, f_phi):
         '''
+        The shaped reward formula behind Point.reward, taking f_delta and
+        f_phi precomputed so that Grid can evaluate them once per turn.
+
+        Args:
+            disposition (Dispositions): Disposition of the point.
+            f_delta (float): SolverContext.f_delta of the point.
+            f_phi (float): SolverContext.f_phi of the board.
+
         Returns:
-            Value between 1 and e representing closeness to a ghost.
+            Float representing the shaped reward.
         '''
-        return exp(
-            (Grid.MAX_DISTANCE - self.min_ghost_distance) / Grid.MAX_DISTANCE
-        )
+        if disposition in {Dispositions.FOOD, Dispositions.CAPSULE}:
+            return Point.REWARDS[disposition] * f_phi / f_delta
 
-    @staticmethod
-    def __f_phi():
+        return Point.REWARDS[disposition] * f_delta
+
+
+class SolverContext(object):
+    '''
+    Everything the solver knows about one game: the dimensions and walls of
+    the layout, the parameters derived from them, and the values that change
+    from turn to turn. Each agent builds its own context at the start of every
+    game, so several games, on different layouts, can run in one process or
+    in threads without sharing any mutable state. Only the immutable per
+    layout tables, MazeDistances and MotionModel, are shared between
+    contexts.
+
+    Inside the solver every open point is addressed by its integer cell id,
+    the id MotionModel gives it. Coordinates only appear where positions
+    come in from the api.
+
+    Attributes:
+        height (int): Height of the layout.
+        width (int): Width of the layout.
+        walls (frozenset): Coordinates of the layout's walls.
+        max_distance (int): Maximum distance between any two points on the
+        board.
+        ghost_radius (int): Radius around ghosts pacman should avoid.
+        iteration_limit (int): Number of sweeps 'fixed' convergence runs.
+        maze_distances (MazeDistances): Maze distance table of the layout, or
+        None for manhattan distances.
+        motion_model (MotionModel): Compiled motion model of the layout.
+        coordinates (list): Coordinate of every open point, indexed by cell
+        id.
+        ids (dict): Maps each open Coordinate to its cell id.
+        cells (list): Cell id of every point of the layout's rectangle,
+        indexed by x * height + y, or None for walls.
+        fill_count (int): Number of filled spaces on the board this turn.
+        gamma (float): Discount factor for this turn.
+    '''
+
+    def __init__(self, state, distance='manhattan'):
+        '''
+        Args:
+            state: Initial game state.
+            distance (str): Metric used for ghost distances, one of
+            MDPAgent.DISTANCES.
+        '''
+        self.height = max([h for _, h in api.corners(state)]) + 1
+        self.width = max([w for w, _ in api.corners(state)]) + 1
+        self.walls = frozenset(api.walls(state))
+        self.max_distance = self.height + self.width - 4
+        self.ghost_radius = 1
+        if self.width > 7 and self.height > 7:  # mediumClassic or bigger
+            self.ghost_radius = 3
+        self.iteration_limit = int(ceil(sqrt(self.height * self.width)) * 2)
+        self.maze_distances = None
+        if distance == 'maze':
+            self.maze_distances = MazeDistances.cached(
+                self.width, self.height, self.walls
+            )
+        self.motion_model = MotionModel.cached(
+            self.width, self.height, self.walls
+        )
+        self.coordinates = self.motion_model.coordinates
+        self.ids = self.motion_model.ids
+        self.cells = [
+            self.ids.get((x, y))
+            for x in xrange(self.width) for y in xrange(self.height)
+        ]
+        self.fill_count = 0
+        self.gamma = None
+
+    def size(self):
         '''
         Returns:
-            Value between 1 and e representing ratio of empty space to filled 
-            space.
+            Integer value representing number points on the grid.
+        '''
+        return (self.height * self.width) - len(self.walls)
+
+    def set_gamma(self, x):
+        '''
+        Set's gamma to SolverContext.discount of x.
         '''
-        return exp((Grid.size() - Grid.FILL_COUNT) / Grid.size())
+        self.gamma = self.discount(x)
 
     @staticmethod
-    def min_distance(coordinate, items):
+    def discount(x):
         '''
-        Finds which item in the list of items is closest to (x, y), according
-        to manhattan distance. Then returns the  distance between the closest
-        item and (x, y).
+        Uses Richard's Curve to distribute x over the open interval (0.6, 1) in
+        a sigmoid curve.
+
+        Returns:
+            Float representing the discount factor for x food and capsules.
+        '''
+        K = 1  # upper asymptote
+        A = 0.6  # lower asymptote
+        B = -0.1  # growth rate
+        M = 5  # growth area midpoint
+        if -B*(x-M) > 700:  # exp overflows, the curve is flat at A by then
+            return A
+        return A + (K-A) / (1 + exp(-B*(x-M)))
 
+    def f_delta(self, min_ghost_distance):
+        '''
         Args:
-            coordinate (Coordinate): (x, y) coordinate of the point
-            items (list): List of coordinates
+            min_ghost_distance (int): Distance from the point to the closest
+            ghost.
+
+        Returns:
+            Value between 1 and e representing closeness to a ghost.
+        '''
+        return exp(
+            (self.max_distance - min_ghost_distance) / self.max_distance
+        )
 
+    def f_phi(self):
+        '''
         Returns:
-            An integer representing the distance between closest item and the 
-            coordinate.
+            Value between 1 and e representing ratio of empty space to filled 
+            space.
         '''
-        if not items:
-            return Grid.MAX_DISTANCE
-        return min(util.manhattan_distance(coordinate, item) for item in items)
+        return exp((self.size() - self.fill_count) / self.size())
 
 
 class Grid(object):
     '''
     Abstraction of a 2D array, used the store all the positions in the game.
+
+    The grid is stored as a struct of arrays: each open point has an integer
+    cell id, given by its context, and each property of the points is one
+    flat array indexed by id. Building the grid every turn therefore
+    allocates a handful of arrays rather than an object per point.
     '''
 
-    # Height of grid
-    HEIGHT = 0
-    # Width of grid
-    WIDTH = 0
-    # Maximum distance between any two points on the board
-    MAX_DISTANCE = 0
-    # Number of filled spaces on the board
-    FILL_COUNT = 0
     # Time remaining in edible mode, where ghosts are still considered safe
     GHOST_SAFE_TIME = 3
-    # Radius around ghosts pacman should avoid
-    GHOST_RADIUS = 1
-    # Walls for the current grid
-    WALLS = set()
+    # Dispositions indexed by their code in Grid.dispositions
+    DISPOSITIONS = (
+        Dispositions.EMPTY,
+        Dispositions.FOOD,
+        Dispositions.CAPSULE,
+        Dispositions.GHOST_HOSTILE,
+        Dispositions.GHOST_EDIBLE,
+        Dispositions.GHOST_NEIGHBOUR,
+    )
+    # Maps each disposition to its code
+    CODES = {
+        disposition: code for code, disposition in enumerate(DISPOSITIONS)
+    }
 
-    def __init__(self, state):
-        '''
-        Instantiates a grid of size Grid.Height * Grid.Width, or size 0 if
-        either Grid.Height or Grid.Width doesn't exist. Setting the relevant 
-        board points from the game state.
+    def __init__(self, state, context):
         '''
-        self.__grid = {
-            Coordinate(x, y): Point()
-            for y in xrange(Grid.HEIGHT) for x in xrange(Grid.WIDTH)
-            if (x, y) not in Grid.WALLS
-        }
-        self.__update_positions(state)
+        Instantiates a grid over the open points of the context's layout,
+        setting the relevant board points from the game state.
 
-    @staticmethod
-    def size():
+        Args:
+            state: Current game state.
+            context (SolverContext): Game the grid belongs to.
+
+        Attributes:
+            context (SolverContext): Game the grid belongs to.
+            utilities (array): Utility of every point, indexed by cell id.
+            rewards (array): Reward of every point for this turn, indexed by
+            cell id.
+            dispositions (array): Code of every point's disposition, before
+            the ghost radius is applied, indexed by cell id.
+            ghost_distances (array): Distance from every point to its closest
+            hostile ghost, capped at the context's max_distance, indexed by
+            cell id.
+            terminals (frozenset): Cell ids of the points whose utility is
+            fixed at their reward for this turn.
+            build_seconds (float): Time taken reading the game state into
+            the grid.
+            shaping_seconds (float): Time taken shaping the rewards.
+        '''
+        started = time()
+        self.context = context
+        size = len(context.coordinates)
+        self.utilities = array('d', [0]) * size
+        self.rewards = array('d', [0]) * size
+        self.dispositions = array('B', [0]) * size
+        self.ghost_distances = array('d', [context.max_distance]) * size
+        distances = self.__update_positions(state)
+        shaping = time()
+        self.__update_rewards(distances)
+        self.build_seconds = shaping - started
+        self.shaping_seconds = time() - shaping
+        # Ghost distances as found, for Grid.eaten
+        self.__distances = distances
+        self.__signature = None
+
+    def size(self):
         '''
         Returns:
             Integer value representing number points on the grid.
         '''
-        return (Grid.HEIGHT * Grid.WIDTH) - len(Grid.WALLS)
+        return self.context.size()
+
+    @property
+    def coordinates(self):
+        '''
+        Returns:
+            List of the coordinate of every point, indexed by cell id.
+        '''
+        return self.context.coordinates
+
+    @property
+    def ids(self):
+        '''
+        Returns:
+            Dictionary mapping the coordinate of every point to its cell id.
+        '''
+        return self.context.ids
+
+    @property
+    def signature(self):
+        '''
+        Only the value cache keys boards by their signature, so it is built
+        on first use rather than with every grid.
+
+        Returns:
+            Tuple of everything the rewards of this turn depend on: the
+            sorted cell ids of the food and of the capsules, the positions
+            of the hostile and of the edible ghosts, and gamma.
+        '''
+        if self.__signature is None:
+            ids = self.context.ids
+            points, gamma = self.__board
+            # Ghost timers only matter either side of GHOST_SAFE_TIME, which
+            # the split into hostile and edible already captures
+            self.__signature = tuple(
+                # Already in id order, so sorting takes linear time
+                tuple(sorted(
+                    ids[Coordinate(x, y)] for x, y in points[disposition]
+                ))
+                for disposition in (Dispositions.FOOD, Dispositions.CAPSULE)
+            ) + tuple(
+                tuple(sorted(points[disposition]))
+                for disposition in
+                (Dispositions.GHOST_HOSTILE, Dispositions.GHOST_EDIBLE)
+            ) + (gamma,)
+        return self.__signature
 
     def __getitem__(self, coordinate):
-        return self.__grid[coordinate]
+        return Point(self, self.context.ids[coordinate])
 
     def __iter__(self):
         '''
         Allows iteration through the coordinates and points of the grid,
         using the 'for coordinate, point in Grid' syntax.
         '''
-        return self.__grid.iteritems()
+        return (
+            (coordinate, Point(self, i))
+            for i, coordinate in enumerate(self.context.coordinates)
+        )
 
     def __contains__(self, coordinate):
         '''
@@ -330,7 +551,46 @@ class Grid(object):
         Returns:
             Bool that is true if coordinate is in the grid, or false otherwise.
         '''
-        return coordinate in self.__grid
+        return coordinate in self.context.ids
+
+    def eaten(self, i):
+        '''
+        Args:
+            i (int): Cell id of a point.
+
+        Returns:
+            The reward point i would have this turn with its food or capsule
+            eaten.
+        '''
+        context = self.context
+        distance = self.__distances.get(i, context.max_distance)
+        disposition = Grid.disposition(
+            Grid.CODES[Dispositions.EMPTY], distance, context.ghost_radius
+        )
+        return Point.shaped_reward(
+            disposition, context.f_delta(distance), context.f_phi()
+        )
+
+    @staticmethod
+    def disposition(code, min_ghost_distance, ghost_radius):
+        '''
+        Args:
+            code (int): Code of a point's disposition in Grid.dispositions.
+            min_ghost_distance (float): Distance from the point to the
+            closest ghost.
+            ghost_radius (int): The context's ghost_radius.
+
+        Returns:
+            The disposition of the point, overridden with
+            Dispositions.GHOST_NEIGHBOUR within the ghost radius of a hostile
+            ghost.
+        '''
+        disposition = Grid.DISPOSITIONS[code]
+        if disposition != Dispositions.GHOST_HOSTILE and \
+                min_ghost_distance <= ghost_radius:
+            return Dispositions.GHOST_NEIGHBOUR
+
+        return disposition
 
     def __update_positions(self, state):
         '''
@@ -339,12 +599,20 @@ class Grid(object):
         spaces.
 
         In addition calculates the number of filled spaces and stores this value
-        statically on Point, for later use in the reward function.
+        on the context, for later use in the reward function, sets the
+        context's gamma for this turn, and keeps what the grid's signature
+        is built from.
 
         Args:
             state: Current game state.
+
+        Returns:
+            Dictionary of the distances from points to their closest hostile
+            ghost, by cell id, as found by Grid.__ghost_distances.
         '''
-        Grid.FILL_COUNT = 0
+        context = self.context
+        ids = context.ids
+        context.fill_count = 0
 
         points = {
             Dispositions.FOOD: api.food(state),
@@ -364,184 +632,2696 @@ class Grid(object):
         for disposition, coordinates in points.iteritems():
             for x, y in coordinates:
                 if disposition in {Dispositions.FOOD, Dispositions.CAPSULE}:
-                    Grid.FILL_COUNT += 1
+                    context.fill_count += 1
                 coordinate = Coordinate(x, y)  # because ghost x, y are floats
-                self[coordinate].disposition = disposition
+                self.dispositions[ids[coordinate]] = Grid.CODES[disposition]
+
+        distances = self.__ghost_distances(points[Dispositions.GHOST_HOSTILE])
+        for i, distance in distances.iteritems():
+            self.ghost_distances[i] = distance
 
-        for coordinate, point in self:
-            point.min_ghost_distance = Point.min_distance(
-                coordinate, points[Dispositions.GHOST_HOSTILE]
+        context.set_gamma(
+            len(points[Dispositions.FOOD] + points[Dispositions.CAPSULE])
+        )
+
+        # What Grid.signature is built from, should it be needed
+        self.__board = (points, context.gamma)
+
+        return distances
+
+    def __ghost_distances(self, ghosts):
+        '''
+        Finds the distance from every point to its closest ghost. With a
+        maze distance table in the context, and no more than
+        MazeDistances.MAX_GHOSTS ghosts, they are read from the table.
+        Otherwise a single breadth first search is seeded from all the
+        ghosts at once, so the cost is linear in the board size whatever the
+        number of ghosts.
+
+        The search runs over the whole rectangle, walls included, which gives
+        exactly the manhattan distance. With a maze distance table it only
+        crosses open points, giving the maze distance, as the table would.
+        Either way it stops at the context's max_distance, beyond which
+        f_delta no longer changes.
+
+        Ghosts between two points (scared ghosts move at half speed) seed
+        both, at the manhattan distance to each, so distances match the
+        nearest ghost's exactly, including whether they are ints or floats.
+        Equal distances are settled in favour of the earlier ghost, as min()
+        does.
+
+        Args:
+            ghosts (list): (x, y) positions of the ghosts, possibly mid-move
+            floats.
+
+        Returns:
+            Dictionary mapping cell ids to the distance to their closest
+            ghost, for every point within max_distance of one.
+        '''
+        context = self.context
+        table = context.maze_distances
+        if table is not None and len(ghosts) <= MazeDistances.MAX_GHOSTS:
+            return table.nearest(ghosts, context.max_distance)
+
+        width, height = context.width, context.height
+        cells = context.cells
+        through_walls = table is None
+        # Cells of the rectangle are numbered x * height + y, and each level
+        # holds the (ghost index, cell, distance) claims at that distance.
+        distances = {}
+        levels = defaultdict(list)
+        for index, ghost in enumerate(ghosts):
+            for seed in Coordinate.around(ghost):
+                if through_walls or seed in context.ids:
+                    distance = util.manhattan_distance(seed, ghost)
+                    levels[distance].append(
+                        (index, seed[0] * height + seed[1], distance)
+                    )
+
+        while levels:
+            level = min(levels)
+            if level > context.max_distance:
+                break
+            for index, cell, distance in sorted(levels.pop(level)):
+                if cell in distances:
+                    continue
+                distances[cell] = distance
+                x, y = divmod(cell, height)
+                for neighbour, inside in (
+                    (cell + height, x + 1 < width),
+                    (cell - height, x > 0),
+                    (cell + 1, y + 1 < height),
+                    (cell - 1, y > 0),
+                ):
+                    if inside and neighbour not in distances and (
+                        through_walls or cells[neighbour] is not None
+                    ):
+                        levels[distance + 1].append(
+                            (index, neighbour, distance + 1)
+                        )
+
+        return {
+            cells[cell]: distance
+            for cell, distance in distances.iteritems()
+            if cells[cell] is not None
+        }
+
+    def __update_rewards(self, distances):
+        '''
+        Evaluates the reward and disposition of every point once for this
+        turn, into Grid.rewards and Grid.terminals, and starts each point's
+        utility off at its reward. Rewards are constant within a turn, so this
+        saves the solvers from recomputing them in every backup. f_phi depends
+        only on the board, and f_delta only on the ghost distance, so each is
+        evaluated once per turn rather than once per point.
+
+        The ghost distances are taken from distances rather than
+        Grid.ghost_distances, which holds them as floats, because f_delta
+        divides them and whole distances divide as ints.
+
+        Args:
+            distances (dict): Distances from points to their closest hostile
+            ghost by cell id, missing for points beyond the context's
+            max_distance.
+        '''
+        context = self.context
+        f_phi = context.f_phi()
+        f_deltas = {}
+        terminals = []
+
+        for i in xrange(len(context.coordinates)):
+            distance = distances.get(i, context.max_distance)
+            if distance not in f_deltas:
+                f_deltas[distance] = context.f_delta(distance)
+            disposition = Grid.disposition(
+                self.dispositions[i], distance, context.ghost_radius
+            )
+            reward = Point.shaped_reward(
+                disposition, f_deltas[distance], f_phi
             )
+            self.rewards[i] = reward
+            self.utilities[i] = reward
+            if disposition in MDPAgent.TERMINAL_DISPOSITIONS:
+                terminals.append(i)
 
-        MDPAgent.set_gamma(len(api.food(state) + api.capsules(state)))
+        self.terminals = frozenset(terminals)
 
 
-@camel_case
-class MDPAgent(Agent):
+class MazeDistances(object):
     '''
-    The MDPAgent the calculates the new utility values, using value interation
-    on every game step. In addition, pick the best next move dependent on the
-    resulting utility values.
+    All-pairs maze distances between the open points of a layout, found by a
+    breadth first search from every open point. Distances are stored in a
+    flat unsigned 16-bit array, indexed by open point id, so any lookup is
+    constant time. The ids are those MotionModel gives the points, as both
+    number the coordinates in sorted order.
+
+    Tables are cached per layout in MazeDistances.CACHE, so repeated games on
+    the same layout only pay for the searches once. A table is never modified
+    once built, so games running in threads can share it.
     '''
 
-    # Convergence iteration limit
-    ITERATION_LIMIT = None
-    # Gamma value in bellman equation
-    GAMMA = None
-    # Probability for each displacement for each direction
-    DIRECTION_PROBABILITIES = {
-        direction: [(
-            Actions._directions[direction],
-            api.direction_prob
-        ), (
-            Actions._directions[Directions.LEFT[direction]],
-            (1-api.direction_prob)/2
-        ), (
-            Actions._directions[Directions.RIGHT[direction]],
-            (1-api.direction_prob)/2
-        )] for direction in Actions._directions.iterkeys()
-    }
+    # Tables already built, keyed by the layout's walls and size
+    CACHE = {}
+    # Guards CACHE, so each layout's table is only built once
+    LOCK = Lock()
+    # Distance recorded between points with no path between them
+    UNREACHABLE = 0xFFFF
+    # Most ghosts for which reading a row of the table per ghost is faster
+    # than one search from all of them
+    MAX_GHOSTS = 4
+
+    def __init__(self, coordinates):
+        '''
+        Args:
+            coordinates (iterable): Coordinates of the open points.
+        '''
+        self.coordinates = sorted(coordinates)
+        self.ids = {
+            coordinate: i for i, coordinate in enumerate(self.coordinates)
+        }
+        size = len(self.coordinates)
+        self.table = array('H', [MazeDistances.UNREACHABLE]) * (size * size)
+
+        displacements = [
+            Actions._directions[direction] for direction in MotionModel.COMPASS
+        ]
+        neighbours = [
+            [
+                self.ids[coordinate+displacement]
+                for displacement in displacements
+                if coordinate+displacement in self.ids
+            ]
+            for coordinate in self.coordinates
+        ]
+        for source in xrange(size):
+            row = source * size
+            self.table[row + source] = 0
+            frontier = [source]
+            distance = 0
+            while frontier:
+                distance += 1
+                reached = []
+                for i in frontier:
+                    for j in neighbours[i]:
+                        if self.table[row + j] == MazeDistances.UNREACHABLE:
+                            self.table[row + j] = distance
+                            reached.append(j)
+                frontier = reached
 
     @classmethod
-    def set_gamma(cls, x):
+    def cached(cls, width, height, walls):
         '''
-        Uses Richard's Curve to distribute x over the open interval (0.6, 1) in
-        a sigmoid curve. Then set's gamma to this value.
+        Args:
+            width (int): Width of the layout.
+            height (int): Height of the layout.
+            walls (frozenset): Coordinates of the layout's walls.
+
+        Returns:
+            The MazeDistances of the layout, built on first use.
         '''
-        K = 1  # upper asymptote
-        A = 0.6  # lower asymptote
-        B = -0.1  # growth rate
-        M = 5  # growth area midpoint
-        cls.GAMMA = A + (K-A) / (1 + exp(-B*(x-M)))
+        key = (width, height, walls)
+        with cls.LOCK:
+            if key not in cls.CACHE:
+                cls.CACHE[key] = cls(
+                    Coordinate(x, y)
+                    for y in xrange(height) for x in xrange(width)
+                    if (x, y) not in walls
+                )
+            return cls.CACHE[key]
+
+    def nearest(self, ghosts, cap):
+        '''
+        Finds the distance from every point to its closest ghost, reading
+        one row of the table per point a ghost lies on.
 
-    @staticmethod
-    def register_initial_state(state):
+        Ghosts between two points (scared ghosts move at half speed) are
+        reached through either, plus the manhattan distance from that point
+        to the ghost. Equal distances are settled in favour of the earlier
+        ghost, as min() does.
+
+        Args:
+            ghosts (list): (x, y) positions of the ghosts, possibly mid-move
+            floats.
+            cap (int): The context's max_distance, beyond which f_delta no
+            longer changes.
+
+        Returns:
+            Dictionary mapping ids to the distance to their closest ghost,
+            for every point within cap of one.
         '''
-        Sets Grid and Point classes' static constants dependant on state, and
-        MDPAgent.ITERATION_LIMIT.
+        size = len(self.coordinates)
+        distances = {}
+        for ghost in ghosts:
+            nearest = {}
+            for seed in Coordinate.around(ghost):
+                if seed not in self.ids:
+                    continue
+                offset = util.manhattan_distance(seed, ghost)
+                start = self.ids[seed] * size
+                for i, steps in enumerate(self.table[start:start + size]):
+                    distance = steps + offset
+                    if distance <= cap and (
+                        i not in nearest or distance < nearest[i]
+                    ):
+                        nearest[i] = distance
+            for i, distance in nearest.iteritems():
+                if i not in distances or distance < distances[i]:
+                    distances[i] = distance
+
+        return distances
+
+
+class MotionModel(object):
+    '''
+    The motion model compiled against the open points of a single layout, so
+    each point can be addressed by an integer id rather than a Coordinate.
+
+    Pacman may stop, or move in any compass direction. A move reaches its
+    intended point with probability api.directionProb, and either
+    perpendicular one with half the rest, or the intended point for certain
+    unless api.nonDeterministic. Stopping has no perpendicular, so all three
+    of its outcomes keep him where he is. Moves into a wall leave him where
+    he is.
+    The game never lets pacman walk into a wall, but the backups still weigh
+    those moves, as a gamble on slipping sideways. The policy only picks
+    among the game's legal moves.
+
+    Attributes:
+        coordinates (list): Coordinate of every open point, indexed by id.
+        ids (dict): Maps each open Coordinate to its id.
+        directions (list): Every direction of the game, stopping included.
+        steps (dict): Maps each direction to a list where steps[i] is the id
+        its intended move reaches from point i, or i itself into a wall.
+        moves (list): The steps of the MotionModel.COMPASS directions, one
+        list per direction, for walking the maze.
+        transitions (list): For each id, per direction, the (id,
+        probability) outcomes of the move, intended outcome first. Outcomes
+        that reach the same point are kept apart, so every backend sums the
+        same terms in the same order, to the last bit.
+        neighbours (dict): Maps each direction to a list of (ids,
+        probabilities) slots, for the vectorised backends. Slot k holds the
+        k-th outcome of the move from every point, padded with a zero
+        probability of staying put.
+        predecessors (list): For each id, the ids whose backups read its
+        utility.
+
+    Models are cached per layout in MotionModel.CACHE, and are never modified
+    once built, so every game on a layout shares one.
+    '''
+
+    # Models already built, keyed by the layout's walls and size, and the
+    # motion settings of api
+    CACHE = {}
+    # Guards CACHE, so each layout's model is only built once
+    LOCK = Lock()
+    # The directions that take pacman to another point
+    COMPASS = (
+        Directions.NORTH, Directions.SOUTH, Directions.EAST, Directions.WEST
+    )
 
+    def __init__(self, coordinates, direction_prob, non_deterministic):
+        '''
         Args:
-            state: Current game state.
+            coordinates (iterable): Coordinates of the open points.
+            direction_prob (float): Probability that a move reaches its
+            intended point.
+            non_deterministic (bool): False if every move reaches its
+            intended point.
         '''
-        Grid.HEIGHT = max([h for _, h in api.corners(state)]) + 1
-        Grid.WIDTH = max([w for w, _ in api.corners(state)]) + 1
-        if Grid.WIDTH > 7 and Grid.HEIGHT > 7:  # mediumClassic or bigger
-            Grid.GHOST_RADIUS = 3
-        Grid.MAX_DISTANCE = Grid.HEIGHT + Grid.WIDTH - 4
-        Grid.WALLS = set(api.walls(state))
-        MDPAgent.ITERATION_LIMIT = int(
-            ceil(sqrt(Grid.HEIGHT * Grid.WIDTH)) * 2
-        )
+        self.coordinates = sorted(coordinates)
+        self.ids = {
+            coordinate: i for i, coordinate in enumerate(self.coordinates)
+        }
+        self.directions = sorted(Actions._directions)
+        self.steps = {
+            direction: self.__displaced(displacement)
+            for direction, displacement in Actions._directions.iteritems()
+        }
+        self.moves = [
+            self.steps[direction] for direction in MotionModel.COMPASS
+        ]
+        size = len(self.coordinates)
+
+        self.transitions = [[] for _ in xrange(size)]
+        for direction in self.directions:
+            if non_deterministic:
+                outcomes = [
+                    (direction, direction_prob),
+                    (Directions.LEFT[direction], (1 - direction_prob) / 2),
+                    (Directions.RIGHT[direction], (1 - direction_prob) / 2),
+                ]
+            else:
+                outcomes = [(direction, 1.0)]
+            for i in xrange(size):
+                self.transitions[i].append([
+                    (self.steps[outcome][i], probability)
+                    for outcome, probability in outcomes
+                ])
+
+        self.neighbours = {}
+        for n, direction in enumerate(self.directions):
+            table = [outcomes[n] for outcomes in self.transitions]
+            width = max(len(outcomes) for outcomes in table)
+            self.neighbours[direction] = [
+                (
+                    [outcomes[k][0] if k < len(outcomes) else i
+                     for i, outcomes in enumerate(table)],
+                    [outcomes[k][1] if k < len(outcomes) else 0.0
+                     for outcomes in table],
+                )
+                for k in xrange(width)
+            ]
+
+        self.predecessors = [set() for _ in self.coordinates]
+        for i, outcomes in enumerate(self.transitions):
+            for direction in outcomes:
+                for j, _ in direction:
+                    self.predecessors[j].add(i)
 
     @classmethod
-    def get_action(cls, state):
+    def cached(cls, width, height, walls):
         '''
-        Picks the best next move dependent on state.
-
         Args:
-            state: Current game state.
+            width (int): Width of the layout.
+            height (int): Height of the layout.
+            walls (frozenset): Coordinates of the layout's walls.
 
         Returns:
-            A direction representing where pacman should move next.
+            The MotionModel of the layout under the current
+            api.directionProb and api.nonDeterministic, built on first use.
         '''
-        grid = Grid(state)
-
-        grid = cls.__value_iteration(grid)
+        # Read from api now rather than at import, so changes to the
+        # settings take effect
+        key = (width, height, walls, api.directionProb, api.nonDeterministic)
+        with cls.LOCK:
+            if key not in cls.CACHE:
+                cls.CACHE[key] = cls(
+                    (
+                        Coordinate(x, y)
+                        for y in xrange(height) for x in xrange(width)
+                        if (x, y) not in walls
+                    ),
+                    api.directionProb,
+                    api.nonDeterministic,
+                )
+            return cls.CACHE[key]
+
+    def __len__(self):
+        return len(self.coordinates)
+
+    def window(self, start, radius):
+        '''
+        Finds the points within radius moves of start, with a breadth first
+        search. Every displacement of the model is one step of a compass
+        direction, so no outcome of a move from a point less than radius
+        moves away leaves the window.
 
-        legal = api.legal_actions(state)
+        Args:
+            start (int): Id of the point the window is centred on.
+            radius (int): Number of moves to the edge of the window.
 
-        direction = cls.__policy(
-            grid,
-            Coordinate(*api.where_am_i(state)),
-            legal,
-        )
+        Returns:
+            Tuple of the list of ids less than radius moves from start,
+            nearest first, and the list of ids exactly radius moves away.
+        '''
+        moves = self.moves
+        inside = []
+        frontier = [start]
+        seen = {start}
+        for _ in xrange(radius):
+            inside.extend(frontier)
+            reached = []
+            for i in frontier:
+                for ids in moves:
+                    if ids[i] not in seen:
+                        seen.add(ids[i])
+                        reached.append(ids[i])
+            frontier = reached
+
+        return inside, frontier
+
+    def expected_utilities(self, utilities, i):
+        '''
+        Calculates the expected utility for moving in each direction from
+        point i.
 
-        return api.make_move(direction, legal)
+        Args:
+            utilities (sequence): Utility of every point, indexed by id.
+            i (int): Id of the point.
 
-    @classmethod
-    def __value_iteration(cls, grid):
+        Returns:
+            Dictionary mapping directions to their utility values.
         '''
-        Calculates and sets new utility values for every point on the grid,
-        repeating until MDPAgent.ITERATION_LIMIT is reached.
+        # A point with no reward, undiscounted, that can only move one way
+        # backs up to the expected utility of that way
+        return {
+            direction: PointValueIteration.backup(
+                utilities, 0, [outcomes], 1
+            )
+            for direction, outcomes in zip(
+                self.directions, self.transitions[i]
+            )
+        }
 
+    def __displaced(self, displacement):
+        '''
         Args:
-            grid (Grid): Grid representing the game state.
+            displacement (tuple): (dx, dy) to apply to every open point.
 
         Returns:
-            A new grid containting updated utility values by performing value
-            iteration on each point.
+            List mapping each id to the id reached by the displacement.
         '''
-        for _ in xrange(MDPAgent.ITERATION_LIMIT):
-            grid_copy = deepcopy(grid)
+        return [
+            self.ids.get(coordinate+displacement, i)
+            for i, coordinate in enumerate(self.coordinates)
+        ]
 
-            for coordinate, point in grid:
-                if point.disposition not in {
-                    Dispositions.GHOST_HOSTILE, Dispositions.GHOST_NEIGHBOUR
-                }:
-                    point.utility = point.reward + \
-                        cls.GAMMA * \
-                        cls.__maximum_expected_utility(grid_copy, coordinate)
 
-        return grid
+class ArrayValueIteration(object):
+    '''
+    Value iteration backend holding the utilities, rewards and terminal mask
+    of a grid in flat NumPy arrays, indexed by MotionModel ids. Each sweep is a
+    handful of vectorised gathers followed by a max over directions, written
+    into buffers allocated once per move.
+
+    Jacobi updates read one utility buffer and write the other, swapping them
+    after each sweep. Gauss-Seidel updates colour the board like a
+    chessboard: every outcome lands on the other colour or back on the
+    point itself, so each colour can be updated in place in one vectorised
+    step, with the second reading the first's fresh utilities.
+
+    When loaded with a window, the arrays only cover the points of the
+    window, renumbered from 0, so each sweep costs time in proportion to the
+    window rather than the board.
+    '''
 
-    @classmethod
-    def __policy(cls, grid, coordinate, legal):
+    def __init__(self, motion_model, update='jacobi'):
         '''
-        Finds the best policy from position (x, y), that's also included in 
-        legal moves.
+        Args:
+            motion_model (MotionModel): Compiled motion model for the layout.
+            update (str): One of MDPAgent.UPDATES.
+        '''
+        self.__model = motion_model
+        self.__update = update
+        self.__neighbours = [
+            [
+                (numpy.array(ids, dtype=numpy.intp), numpy.array(probability))
+                for ids, probability in motion_model.neighbours[direction]
+            ]
+            for direction in motion_model.directions
+        ]
+        self.__colours = numpy.array([
+            (x + y) % 2 for x, y in motion_model.coordinates
+        ])
+        self.__phases = self.__compile(self.__neighbours, self.__colours)
+        # Ids of the points the arrays cover, or None for the whole board
+        self.__cells = None
+
+    def __compile(self, neighbours, colours):
+        '''
+        Args:
+            neighbours (list): Per direction, the (ids, probability) pairs of
+            each slot of MotionModel.neighbours, as arrays.
+            colours (ndarray): Chessboard colour of each point.
+
+        Returns:
+            List of (phase, neighbours) pairs, one per vectorised update,
+            where phase holds the indices the update writes, or is None for
+            all of them.
+        '''
+        if self.__update == 'jacobi':
+            return [(None, neighbours)]
+
+        return [
+            (phase, [
+                [
+                    (ids[phase], probability[phase])
+                    for ids, probability in outcomes
+                ]
+                for outcomes in neighbours
+            ])
+            for phase in (
+                numpy.flatnonzero(colours == 0),
+                numpy.flatnonzero(colours == 1),
+            )
+        ]
+
+    def load(self, grid, gamma, window=None):
+        '''
+        Reads the rewards, terminal mask and starting utilities of grid into
+        flat arrays, and allocates the buffers the sweeps work in.
 
         Args:
-            coordinate (Coordinate): (x, y) coordinate of the point
             grid (Grid): Grid representing the game state.
-            legal (list): List of legal moves from current position
+            gamma (float): Discount factor.
+            window (tuple): Optional (inside, edge) pair of id lists, as
+            returned by MotionModel.window. Only the points inside are
+            backed up, and the points on the edge hold their current utility
+            throughout.
+        '''
+        rewards = numpy.array(grid.rewards)
+        terminal = numpy.zeros(len(self.__model), dtype=bool)
+        terminal[list(grid.terminals)] = True
+        self.__gamma = gamma
+        self.__utilities = numpy.array(grid.utilities)
+        phases = self.__phases
+        self.__cells = None
+        if window is not None:
+            rewards, terminal, phases = self.__restrict(
+                rewards, terminal, *window
+            )
+        self.__work = []
+        for phase, neighbours in phases:
+            size = len(rewards) if phase is None else len(phase)
+            select = slice(None) if phase is None else phase
+            self.__work.append((
+                phase,
+                neighbours,
+                rewards[select],
+                terminal[select],
+                numpy.empty((len(neighbours), size)),  # expected utilities
+                numpy.empty(size),  # gathered utilities
+                numpy.empty(size),  # updated utilities
+            ))
+
+    def __restrict(self, rewards, terminal, inside, edge):
+        '''
+        Narrows the loaded arrays down to the points of a window, renumbered
+        in the order inside + edge. Edge points are made terminal, with their
+        current utility standing in for their reward. Moves out of the
+        window, which only edge points have, stay put.
+
+        Args:
+            rewards (ndarray): Rewards of the whole board.
+            terminal (ndarray): Terminal mask of the whole board.
+            inside (list): Ids of the points to back up.
+            edge (list): Ids of the points around them.
 
         Returns:
-            Direction representing the optimum policy from (x, y)
+            Tuple of the rewards and terminal mask of the window, and its
+            phases, as returned by __compile.
         '''
-        return max(
-            (utility, direction)
-            for direction, utility in
-            cls.__expected_utilities(grid, coordinate).iteritems()
-            if direction in legal
-        )[1]
+        cells = numpy.array(inside + edge, dtype=numpy.intp)
+        local = numpy.arange(len(cells))
+        renumber = numpy.full(len(self.__model), -1, dtype=numpy.intp)
+        renumber[cells] = local
+        neighbours = []
+        for outcomes in self.__neighbours:
+            neighbours.append([])
+            for ids, probability in outcomes:
+                ids = renumber[ids[cells]]
+                outside = ids < 0
+                ids[outside] = local[outside]
+                neighbours[-1].append((ids, probability[cells]))
+
+        self.__utilities = self.__utilities[cells]
+        self.__cells = cells
+        rewards = rewards[cells]
+        rewards[len(inside):] = self.__utilities[len(inside):]
+        terminal = terminal[cells]
+        terminal[len(inside):] = True
+
+        return (
+            rewards,
+            terminal,
+            self.__compile(neighbours, self.__colours[cells]),
+        )
 
-    @classmethod
-    def __maximum_expected_utility(cls, grid, coordinate):
+    @staticmethod
+    def backup(utilities, neighbours, gamma, rewards, terminal, expected,
+               gathered, updated, axis=None):
         '''
-        Calculates and returns the maximum expected utility at (x, y).
+        The vectorised Bellman backup every NumPy backend sweeps with. Each
+        expected utility is summed in outcome order, as the pure Python
+        path does, so all the backends agree to the last bit.
 
         Args:
-            coordinate (Coordinate): (x, y) coordinate of the point
-            grid (Grid): Grid representing the game state.
+            utilities (ndarray): Utilities to read.
+            neighbours (list): Per direction, the (ids, probability) pairs
+            of each outcome slot, as arrays, for the points to back up.
+            gamma: Discount factor, or a column of them, one per board.
+            rewards (ndarray): Rewards of the points to back up.
+            terminal (ndarray): Terminal mask of the points to back up.
+            expected (ndarray): Buffer of the expected utilities, one row
+            per direction.
+            gathered (ndarray): Buffer of the gathered utilities.
+            updated (ndarray): Buffer the backed up utilities are written to.
+            axis (int): Axis of utilities the ids index, or None if it is
+            flat.
+        '''
+        for row, outcomes in zip(expected, neighbours):
+            (ids, probability), rest = outcomes[0], outcomes[1:]
+            numpy.take(utilities, ids, axis=axis, out=row)
+            row *= probability
+            for ids, probability in rest:
+                numpy.take(utilities, ids, axis=axis, out=gathered)
+                gathered *= probability
+                row += gathered
+        expected.max(axis=0, out=updated)
+        updated *= gamma
+        updated += rewards
+        numpy.copyto(updated, rewards, where=terminal)
+
+    def sweep(self):
+        '''
+        Performs one Bellman backup of every point.
 
         Returns:
-            Floating point number representing maximum expected utility.
+            Float representing the max-norm Bellman residual of the sweep.
         '''
-        return max(cls.__expected_utilities(grid, coordinate).values())
+        residual = 0.0
+        for i, work in enumerate(self.__work):
+            phase, neighbours, rewards, terminal, expected, gathered, updated \
+                = work
+            utilities = self.__utilities
+            ArrayValueIteration.backup(
+                utilities, neighbours, self.__gamma, rewards, terminal,
+                expected, gathered, updated,
+            )
 
-    @classmethod
-    def __expected_utilities(cls, grid, coordinate):
+            if phase is None:
+                numpy.subtract(updated, utilities, out=gathered)
+                # Swap the buffers
+                self.__utilities = updated
+                self.__work[i] = work[:-1] + (utilities,)
+            else:
+                numpy.take(utilities, phase, out=gathered)
+                numpy.subtract(updated, gathered, out=gathered)
+                utilities[phase] = updated
+            numpy.absolute(gathered, out=gathered)
+            residual = max(residual, float(gathered.max()))
+
+        return residual
+
+    def store(self, grid):
         '''
-        Calculates the expected utility for moving in each direction from 
-        (x, y).
+        Writes the current utilities back onto the points of grid.
 
         Args:
-            coordinate (Coordinate): (x, y) coordinate of the point
-            grid (Grid): Grid representing the game state.
+            grid (Grid): Grid the utilities were loaded from.
 
         Returns:
-            Dictionary mapping directions to their utility values.
+            The same grid, with updated utility values.
         '''
-        expected_utilities = defaultdict(int)
+        if self.__cells is None:
+            grid.utilities[:] = array('d', self.__utilities.tolist())
+        else:
+            for i, utility in zip(
+                self.__cells.tolist(), self.__utilities.tolist()
+            ):
+                grid.utilities[i] = utility
 
-        for direction, probabilities in \
-                MDPAgent.DIRECTION_PROBABILITIES.iteritems():
-            for displacement, probability in probabilities:
-                if coordinate+displacement in grid:
-                    expected_utilities[direction] += probability * \
-                        grid[coordinate+displacement].utility
-                else:
-                    expected_utilities[direction] += probability * \
-                        grid[coordinate].utility
+        return grid
+
+
+class BatchValueIteration(object):
+    '''
+    Value iteration backend solving several boards of one layout at once.
+    The utilities, rewards and terminal masks of K boards are stacked into
+    K by N arrays, so each sweep is one ArrayValueIteration.backup, each of
+    its vectorised gathers covering every board, and the interpreter
+    overhead of a sweep is paid once rather than K times.
+
+    Each board stops sweeping on its own stopping rule: once a board's
+    residual is at or below its threshold, its row is no longer written, so
+    every board gets exactly the sweeps, and utilities, that solving it
+    alone with the numpy solver would give. Updates are Jacobi.
+    '''
+
+    def __init__(self, motion_model):
+        '''
+        Args:
+            motion_model (MotionModel): Compiled motion model for the layout.
+        '''
+        self.__model = motion_model
+        self.__neighbours = [
+            [
+                (numpy.array(ids, dtype=numpy.intp), numpy.array(probability))
+                for ids, probability in motion_model.neighbours[direction]
+            ]
+            for direction in motion_model.directions
+        ]
+
+    def solve(self, grids, gammas, limits, thresholds):
+        '''
+        Value iterates over every grid, writing the utilities back onto it.
 
-        return expected_utilities
+        Args:
+            grids (list): Grids of the boards, all of this layout.
+            gammas (list): Discount factor of each board.
+            limits (list): Maximum number of sweeps of each board.
+            thresholds (list): Residual at or below which each board stops.
+
+        Returns:
+            List of the (sweeps, final residual) of each board.
+        '''
+        size = len(grids)
+        utilities = numpy.array([grid.utilities for grid in grids])
+        rewards = numpy.array([grid.rewards for grid in grids])
+        terminal = numpy.zeros(utilities.shape, dtype=bool)
+        for row, grid in zip(terminal, grids):
+            row[list(grid.terminals)] = True
+        gammas = numpy.array(gammas)[:, None]
+        limits = numpy.array(limits)
+        thresholds = numpy.array(thresholds)
+
+        expected = numpy.empty((len(self.__neighbours),) + utilities.shape)
+        gathered = numpy.empty(utilities.shape)
+        updated = numpy.empty(utilities.shape)
+        sweeps = numpy.zeros(size, dtype=int)
+        residuals = numpy.full(size, float('inf'))
+        active = limits > 0
+
+        while active.any():
+            ArrayValueIteration.backup(
+                utilities, self.__neighbours, gammas, rewards, terminal,
+                expected, gathered, updated, axis=1,
+            )
+
+            numpy.subtract(updated, utilities, out=gathered)
+            numpy.absolute(gathered, out=gathered)
+            residuals[active] = gathered.max(axis=1)[active]
+            utilities[active] = updated[active]
+            sweeps[active] += 1
+            active &= (residuals > thresholds) & (sweeps < limits)
+
+        for grid, row in zip(grids, utilities):
+            grid.utilities[:] = array('d', row.tolist())
+
+        return zip(sweeps.tolist(), residuals.tolist())
+
+
+class TileValueIteration(object):
+    '''
+    Parallel value iteration backend. The open points are split into
+    vertical strips of equal size, and each strip is handed to its own
+    worker process, which keeps running for the whole game. Cell ids are in
+    x-major order, so each strip is a run of consecutive ids.
+
+    Utilities live in two buffers of shared memory, which the workers and
+    the agent all see as NumPy arrays. Updates are Jacobi: every worker
+    reads its strip and the halo of points around it from one buffer, and
+    writes its strip into the other. Reading the halo straight from shared
+    memory stands in for exchanging boundary rows. The agent sends every
+    worker the discount factor and the buffer to read, and waits for all
+    of their residuals before the next sweep, which keeps the sweeps in
+    step. Each strip is backed up with ArrayValueIteration.backup, so the
+    two agree to the last bit.
+    '''
+
+    def __init__(self, motion_model, workers):
+        '''
+        Starts the worker processes.
+
+        Args:
+            motion_model (MotionModel): Compiled motion model for the layout.
+            workers (int): Number of worker processes, and so of strips.
+        '''
+        size = len(motion_model)
+        self.__model = motion_model
+        self.__buffers = [Array('d', size, lock=False) for _ in xrange(2)]
+        self.__rewards = Array('d', size, lock=False)
+        self.__terminal = Array('b', size, lock=False)
+        # Buffer holding the latest utilities
+        self.__parity = 0
+        self.__gamma = None
+
+        bounds = [size * n // workers for n in xrange(workers + 1)]
+        self.__connections = []
+        self.__workers = []
+        for start, stop in zip(bounds, bounds[1:]):
+            connection, worker_connection = Pipe()
+            worker = Process(
+                target=self.__work, args=(worker_connection, start, stop)
+            )
+            worker.daemon = True
+            worker.start()
+            self.__connections.append(connection)
+            self.__workers.append(worker)
+
+    def __views(self):
+        '''
+        Returns:
+            NumPy views of the two utility buffers, the rewards and the
+            terminal mask, in shared memory.
+        '''
+        as_array = numpy.ctypeslib.as_array
+        return (
+            [as_array(buffer) for buffer in self.__buffers],
+            as_array(self.__rewards),
+            as_array(self.__terminal).view(bool),
+        )
+
+    def __work(self, connection, start, stop):
+        '''
+        Main loop of a worker process, backing up the points with ids from
+        start up to stop once per message, until sent None.
+
+        Args:
+            connection (Connection): Worker's end of its pipe to the agent.
+            start (int): First id of the worker's strip.
+            stop (int): Id after the last of the worker's strip.
+        '''
+        buffers, rewards, terminal = self.__views()
+        model = self.__model
+        strip = slice(start, stop)
+        neighbours = [
+            [
+                (
+                    numpy.array(ids[strip], dtype=numpy.intp),
+                    numpy.array(probability[strip]),
+                )
+                for ids, probability in model.neighbours[direction]
+            ]
+            for direction in model.directions
+        ]
+        expected = numpy.empty((len(neighbours), stop - start))
+        gathered = numpy.empty(stop - start)
+        updated = numpy.empty(stop - start)
+
+        while True:
+            message = connection.recv()
+            if message is None:
+                break
+            gamma, parity = message
+            read, write = buffers[parity], buffers[1 - parity]
+            ArrayValueIteration.backup(
+                read, neighbours, gamma, rewards[strip], terminal[strip],
+                expected, gathered, updated,
+            )
+
+            numpy.subtract(updated, read[strip], out=gathered)
+            numpy.absolute(gathered, out=gathered)
+            write[strip] = updated
+            connection.send(float(gathered.max()) if len(gathered) else 0.0)
+
+    def load(self, grid, gamma):
+        '''
+        Copies the rewards, terminal mask and starting utilities of grid into
+        shared memory.
+
+        Args:
+            grid (Grid): Grid representing the game state.
+            gamma (float): Discount factor.
+        '''
+        buffers, rewards, terminal = self.__views()
+        rewards[:] = grid.rewards
+        terminal[:] = False
+        terminal[list(grid.terminals)] = True
+        for buffer in buffers:
+            buffer[:] = grid.utilities
+        self.__gamma = gamma
+        self.__parity = 0
+
+    def sweep(self):
+        '''
+        Has every worker back up its strip, and waits for them all.
+
+        Returns:
+            Float representing the max-norm Bellman residual of the sweep.
+        '''
+        for connection in self.__connections:
+            connection.send((self.__gamma, self.__parity))
+        residual = max(
+            connection.recv() for connection in self.__connections
+        )
+        self.__parity = 1 - self.__parity
+
+        return residual
+
+    def store(self, grid):
+        '''
+        Writes the current utilities back onto the points of grid.
+
+        Args:
+            grid (Grid): Grid the utilities were loaded from.
+
+        Returns:
+            The same grid, with updated utility values.
+        '''
+        grid.utilities[:] = array('d', self.__buffers[self.__parity])
+
+        return grid
+
+    def close(self):
+        '''
+        Stops the worker processes.
+        '''
+        for connection in self.__connections:
+            connection.send(None)
+        for worker in self.__workers:
+            worker.join()
+        self.__connections = []
+        self.__workers = []
+
+
+class PointValueIteration(object):
+    '''
+    Pure Python value iteration backend, working on the cell ids of a motion
+    model. Utilities live in two lists allocated once per move: Jacobi
+    updates read one and write the other, swapping them after each sweep,
+    while Gauss-Seidel updates read and write the same list, in a
+    configurable order.
+    '''
+
+    def __init__(self, motion_model, update='jacobi', order='board'):
+        '''
+        Args:
+            motion_model (MotionModel): Compiled motion model for the layout.
+            update (str): One of MDPAgent.UPDATES.
+            order (str): One of MDPAgent.ORDERS.
+        '''
+        self.__model = motion_model
+        self.__update = update
+        self.__order = order
+
+    def load(self, grid, gamma, pacman, window=None):
+        '''
+        Reads the starting utilities of grid, and fixes the order its points
+        are swept in.
+
+        Args:
+            grid (Grid): Grid representing the game state.
+            gamma (float): Discount factor.
+            pacman (int): Cell id of pacman's position.
+            window (tuple): Optional (inside, edge) pair of id lists, as
+            returned by MotionModel.window. Only the points inside are
+            backed up, so the points on the edge hold their current utility
+            throughout.
+        '''
+        self.__gamma = gamma
+        self.__read = grid.utilities.tolist()
+        if self.__update == 'jacobi':
+            self.__write = self.__read[:]
+        else:
+            self.__write = self.__read
+
+        if window is not None:
+            # The window is already in outward order
+            order = list(window[0])
+            if self.__order == 'board':
+                order.sort()
+        elif self.__order == 'board':
+            order = xrange(len(self.__model))
+        else:
+            order = self.outward(self.__model, pacman)
+        if self.__order == 'inward':
+            order.reverse()
+        transitions = self.__model.transitions
+        self.__points = [
+            (i, grid.rewards[i], transitions[i])
+            for i in order if i not in grid.terminals
+        ]
+
+    def sweep(self):
+        '''
+        Performs one Bellman backup of every point.
+
+        Returns:
+            Float representing the max-norm Bellman residual of the sweep.
+        '''
+        read, write = self.__read, self.__write
+        gamma = self.__gamma
+        residual = 0
+
+        backup = PointValueIteration.backup
+
+        for i, reward, outcomes in self.__points:
+            utility = backup(read, reward, outcomes, gamma)
+            difference = abs(utility - read[i])
+            if difference > residual:
+                residual = difference
+            write[i] = utility
+
+        self.__read, self.__write = write, read
+        return residual
+
+    @staticmethod
+    def backup(utilities, reward, outcomes, gamma):
+        '''
+        The Bellman backup of one point that every pure Python backend
+        sweeps with. Each expected utility is summed in outcome order,
+        starting from an int 0, as ArrayValueIteration.backup does, so all
+        the backends agree to the last bit.
+
+        Args:
+            utilities (sequence): Utilities to read, indexed by id.
+            reward (float): Reward of the point.
+            outcomes (list): The point's transitions, from
+            MotionModel.transitions.
+            gamma (float): Discount factor.
+
+        Returns:
+            Float representing the backed up utility of the point.
+        '''
+        best = None
+        for direction in outcomes:
+            expected = 0
+            for j, probability in direction:
+                expected += probability * utilities[j]
+            if best is None or expected > best:
+                best = expected
+        return reward + gamma * best
+
+    def store(self, grid):
+        '''
+        Writes the current utilities back onto the points of grid.
+
+        Args:
+            grid (Grid): Grid the utilities were loaded from.
+
+        Returns:
+            The same grid, with updated utility values.
+        '''
+        grid.utilities[:] = array('d', self.__read)
+
+        return grid
+
+    @staticmethod
+    def outward(motion_model, start):
+        '''
+        Orders the points of a motion model by maze distance from start, with
+        a breadth first search.
+
+        Args:
+            motion_model (MotionModel): Compiled motion model for the layout.
+            start (int): Cell id the search starts from.
+
+        Returns:
+            List of the cell ids reachable from start, nearest first,
+            followed by any unreachable ones.
+        '''
+        moves = motion_model.moves
+        order = [start]
+        seen = {start}
+        for i in order:
+            for ids in moves:
+                if ids[i] not in seen:
+                    seen.add(ids[i])
+                    order.append(ids[i])
+
+        return order + [
+            i for i in xrange(len(motion_model)) if i not in seen
+        ]
+
+
+class PrioritizedSweeping(object):
+    '''
+    Incremental value iteration backend. It remembers the rewards, terminal
+    mask and utilities it finished the previous move with, and an upper
+    bound on the Bellman error of every point. A board change raises each
+    point's bound by as much as it can move that point's error, and only
+    the points whose bound rises above the threshold have their error
+    computed. Those still above it are backed up, in decreasing order of
+    error, with their predecessors queued in turn.
+
+    The shaped rewards of most points, and gamma, drift a little every move
+    as food is eaten, so points are backed up until their error is well
+    below the threshold. The headroom left absorbs many moves of small
+    drift before a point needs looking at again, so per-move work follows
+    the points the board change moved by a meaningful amount rather than
+    the size of the board. When those are a large share of the board, as
+    after the ghosts move, whole sweeps from the previous utilities are
+    cheaper than queueing, and are run instead.
+    '''
+
+    # Share of the threshold points are backed up to, leaving the rest as
+    # headroom for the drift of later moves
+    TOLERANCE = 0.5
+    # Share of the points above the threshold beyond which whole sweeps are
+    # cheaper than queueing
+    SWEEP_SHARE = 0.25
+
+    def __init__(self, motion_model):
+        '''
+        Args:
+            motion_model (MotionModel): Compiled motion model for the layout.
+        '''
+        self.__model = motion_model
+        # Runs the whole sweeps, when those are cheaper than queueing
+        self.__sweeper = PointValueIteration(motion_model, 'gauss_seidel')
+        self.reset()
+
+    def reset(self):
+        '''
+        Forgets the previous move, so the next solve starts from scratch.
+        '''
+        self.__gamma = None
+        self.__rewards = None
+        self.__terminal = None
+        self.__utilities = None
+        self.__errors = None
+
+    def adopt(self, board, gamma, residual):
+        '''
+        Takes a board solved elsewhere, such as a speculation solved in the
+        background or a field from the value cache, as the previous move, so
+        the next solve only backs up the points where the board differs.
+
+        Args:
+            board (Grid): Solved grid, or Speculation.
+            gamma (float): Discount factor the board was solved with.
+            residual (float): Final residual of the board's solve, taken as
+            the bound on the Bellman error of each of its points.
+        '''
+        self.__gamma = gamma
+        self.__rewards = board.rewards.tolist()
+        self.__terminal = [
+            i in board.terminals for i in xrange(len(self.__model))
+        ]
+        self.__utilities = board.utilities.tolist()
+        self.__errors = [
+            0 if terminal else residual for terminal in self.__terminal
+        ]
+
+    def solve(self, grid, gamma, threshold, max_backups, deadline=None):
+        '''
+        Updates the utilities left by the previous move to the board in
+        grid, then writes them onto its points.
+
+        Args:
+            grid (Grid): Grid representing the game state.
+            gamma (float): Discount factor.
+            threshold (float): Bellman error every point must be brought to
+            or below.
+            max_backups (int): Hard cap on the number of backups.
+            deadline (float): Time by which backing up must stop, if any.
+
+        Returns:
+            Tuple of the number of backups performed and the largest bound on
+            the Bellman error of any point.
+        '''
+        size = len(self.__model)
+        rewards = grid.rewards.tolist()
+        terminal = [i in grid.terminals for i in xrange(size)]
+
+        if self.__utilities is None:
+            utilities = rewards[:]
+            errors = [0 if t else float('inf') for t in terminal]
+        else:
+            utilities = self.__utilities
+            errors = self.__drift(rewards, terminal, gamma)
+
+        self.__gamma = gamma
+        self.__rewards = rewards
+        self.__terminal = terminal
+        self.__utilities = utilities
+        self.__errors = errors
+
+        tolerance = threshold * PrioritizedSweeping.TOLERANCE
+        changed = [i for i in xrange(size) if errors[i] > threshold]
+        if len(changed) > size * PrioritizedSweeping.SWEEP_SHARE:
+            backups = self.__sweep(grid, tolerance, max_backups, deadline)
+            return backups, max(errors)
+
+        queue = util.PriorityQueue()
+        for i in changed:
+            self.__enqueue(queue, i, tolerance)
+
+        backups = 0
+        while not queue.isEmpty() and backups < max_backups:
+            if deadline is not None and time() > deadline:
+                break
+            i = queue.pop()
+            # Entries are never removed, so recheck the current error
+            errors[i] = self.__error(i)
+            if errors[i] <= tolerance:
+                continue
+            utilities[i] = self.__backup(i)
+            errors[i] = 0
+            backups += 1
+            for j in self.__model.predecessors[i]:
+                self.__enqueue(queue, j, tolerance)
+
+        grid.utilities[:] = array('d', utilities)
+
+        return backups, max(errors)
+
+    def __sweep(self, grid, tolerance, max_backups, deadline):
+        '''
+        Backs up every non-terminal point in place, with a Gauss-Seidel
+        PointValueIteration, until a sweep changes no utility by more than
+        the tolerance, and writes the utilities onto grid. After a sweep
+        that changed no utility by more than some delta, every point's
+        backup reads utilities within delta of the current ones, so its
+        Bellman error is at most gamma times delta.
+
+        Returns:
+            The number of backups performed.
+        '''
+        points = [
+            i for i, terminal in enumerate(self.__terminal) if not terminal
+        ]
+        grid.utilities[:] = array('d', self.__utilities)
+        self.__sweeper.load(grid, self.__gamma, None)
+        backups = 0
+        change = float('inf')
+        while change > tolerance and backups < max_backups:
+            if deadline is not None and time() > deadline:
+                break
+            change = self.__sweeper.sweep()
+            backups += len(points)
+        self.__sweeper.store(grid)
+
+        self.__utilities = grid.utilities.tolist()
+        for i in points:
+            self.__errors[i] = self.__gamma * change
+
+        return backups
+
+    def __drift(self, rewards, terminal, gamma):
+        '''
+        Moves the previous move's utilities and error bounds on to a new
+        board. Terminal points take their new reward as their utility. Every
+        other point's error can grow by no more than the change in its
+        reward, plus the change in gamma times the largest utility, plus
+        gamma times the change in utility of any terminal point it can
+        reach. Points that have stopped being terminal have no bound.
+
+        Args:
+            rewards (list): Rewards of the new board.
+            terminal (list): Terminal mask of the new board.
+            gamma (float): Discount factor of the new board.
+
+        Returns:
+            List of the error bound of every point on the new board.
+        '''
+        utilities = self.__utilities
+        errors = self.__errors
+        drift = abs(gamma - self.__gamma) * max(
+            max(utilities), -min(utilities)
+        )
+        for i in xrange(len(utilities)):
+            if terminal[i]:
+                shift = abs(rewards[i] - utilities[i])
+                if shift:
+                    utilities[i] = rewards[i]
+                    for j in self.__model.predecessors[i]:
+                        errors[j] += gamma * shift
+            elif self.__terminal[i]:
+                errors[i] = float('inf')
+            else:
+                errors[i] += abs(rewards[i] - self.__rewards[i]) + drift
+        for i in xrange(len(utilities)):
+            if terminal[i]:
+                errors[i] = 0
+
+        return errors
+
+    def __enqueue(self, queue, i, tolerance):
+        '''
+        Computes the Bellman error of point i, and queues it if above the
+        tolerance.
+        '''
+        self.__errors[i] = error = self.__error(i)
+        if error > tolerance:
+            queue.push(i, -error)
+
+    def __error(self, i):
+        '''
+        Returns:
+            Float representing the Bellman error of point i.
+        '''
+        if self.__terminal[i]:
+            return 0
+        return abs(self.__backup(i) - self.__utilities[i])
+
+    def __backup(self, i):
+        '''
+        Returns:
+            Float representing the Bellman backup of point i.
+        '''
+        return PointValueIteration.backup(
+            self.__utilities, self.__rewards[i], self.__model.transitions[i],
+            self.__gamma,
+        )
+
+
+class CorridorGraph(object):
+    '''
+    The corridors of a layout, found once per layout. A corridor point has
+    exactly two open neighbours, straight through or round a bend, so every
+    outcome of every move from it advances, goes back or stays put. Every
+    other open point, a junction or a dead end, is a node, and each maximal
+    run of corridor points joins two nodes, or one node to itself for a
+    loop.
+
+    Attributes:
+        nodes (list): Ids of the nodes.
+        chains (list): (a, cells, b) triples, one per corridor, where cells
+        lists the ids along it in order from node a to node b.
+        chain_of (dict): Maps the id of every corridor point to the index of
+        its chain and its position along it.
+    '''
+
+    # Graphs already built, keyed by the layout's walls and size
+    CACHE = {}
+    # Guards CACHE, so each layout's graph is only built once
+    LOCK = Lock()
+
+    def __init__(self, motion_model):
+        '''
+        Args:
+            motion_model (MotionModel): Compiled motion model for the layout.
+        '''
+        moves = motion_model.moves
+        # Maps every corridor point to its two open neighbours
+        corridor = {}
+        for i in xrange(len(motion_model)):
+            neighbours = [ids[i] for ids in moves if ids[i] != i]
+            if len(neighbours) == 2:
+                corridor[i] = tuple(neighbours)
+        self.nodes = [
+            i for i in xrange(len(motion_model)) if i not in corridor
+        ]
+
+        self.chains = []
+        self.chain_of = {}
+        for start in sorted(corridor):
+            if start in self.chain_of:
+                continue
+            # Walk to the node at one end, then along to the other
+            previous, i = corridor[start][1], start
+            while i in corridor:
+                previous, i = i, self.__onward(corridor, previous, i)
+                if i == start:
+                    # A loop with no junction, so start becomes its node
+                    del corridor[start]
+                    self.nodes.append(start)
+            a, previous, i = i, i, previous
+            cells = []
+            while i in corridor:
+                self.chain_of[i] = (len(self.chains), len(cells))
+                cells.append(i)
+                previous, i = i, self.__onward(corridor, previous, i)
+            self.chains.append((a, cells, i))
+
+    @staticmethod
+    def __onward(corridor, previous, i):
+        '''
+        Args:
+            corridor (dict): Maps corridor points to their open neighbours.
+            previous (int): Id of the point the walk came from.
+            i (int): Id of a corridor point next to previous.
+
+        Returns:
+            Id of the point after i, walking away from previous.
+        '''
+        a, b = corridor[i]
+        return b if a == previous else a
+
+    @classmethod
+    def cached(cls, width, height, walls):
+        '''
+        Args:
+            width (int): Width of the layout.
+            height (int): Height of the layout.
+            walls (frozenset): Coordinates of the layout's walls.
+
+        Returns:
+            The CorridorGraph of the layout, built on first use.
+        '''
+        key = (width, height, walls)
+        with cls.LOCK:
+            if key not in cls.CACHE:
+                cls.CACHE[key] = cls(MotionModel.cached(width, height, walls))
+            return cls.CACHE[key]
+
+
+class CorridorValueIteration(object):
+    '''
+    Value iteration backend over a CorridorGraph. Only nodes are backed up,
+    and each stretch of corridor between two nodes is collapsed into a
+    weighted edge.
+
+    While every point of a stretch c_1 .. c_m from node a to node b heads
+    the same way, each point's utility depends only on its two neighbours:
+
+        U(c_i) = R(c_i) + gamma * (f_i * U(c_i+1) + k_i * U(c_i-1)
+                                   + s_i * U(c_i)),
+
+    where f_i, k_i and s_i are the probabilities of advancing, being
+    knocked back and staying put. In a straight corridor f_i = p and
+    s_i = 1 - p, so U(c_i) = R(c_i) / (1 - (1 - p) * gamma) + rho * U(c_i+1)
+    with rho = p * gamma / (1 - (1 - p) * gamma), the discount per step.
+    Eliminating the tridiagonal system once per move writes each end of the
+    stretch as an aggregated reward plus discounted multiples of U(a) and
+    U(b). An end point is worth the best of heading for a, heading for b, or
+    heading for some point along the stretch and stopping there for good,
+    which matters because a food reward is earned on every move spent on
+    it. Turning round part way along is never considered. Backing up a node
+    then costs little more than on the full board.
+
+    Pacman's point and the terminal points are made nodes for the move,
+    which splits any stretch they lie on, so the points pacman can move to
+    are always nodes or the ends of stretches. Only those are written back
+    to the grid, along with the nodes.
+    '''
+
+    def __init__(self, corridor_graph, motion_model, update='jacobi'):
+        '''
+        Args:
+            corridor_graph (CorridorGraph): Corridors of the layout.
+            motion_model (MotionModel): Compiled motion model for the layout.
+            update (str): One of MDPAgent.UPDATES.
+        '''
+        self.__graph = corridor_graph
+        self.__model = motion_model
+        self.__update = update
+        # Number of nodes in the last move's graph
+        self.size = 0
+
+    def load(self, grid, gamma, pacman):
+        '''
+        Builds this move's graph: its nodes, the aggregated rewards and
+        discounts of each stretch, and the outcomes of every node's moves.
+
+        Args:
+            grid (Grid): Grid representing the game state.
+            gamma (float): Discount factor.
+            pacman (int): Cell id of pacman's position.
+        '''
+        graph = self.__graph
+
+        # Pacman and terminals on a corridor cut it for this move
+        cuts = defaultdict(list)
+        for i in grid.terminals | {pacman}:
+            if i in graph.chain_of:
+                chain, position = graph.chain_of[i]
+                cuts[chain].append(position)
+
+        nodes = list(graph.nodes)
+        stretches = []
+        for chain, (a, cells, b) in enumerate(graph.chains):
+            start = 0
+            for position in sorted(cuts[chain]):
+                nodes.append(cells[position])
+                stretches.append((a, cells[start:position], cells[position]))
+                a, start = cells[position], position + 1
+            stretches.append((a, cells[start:], b))
+        index = {i: n for n, i in enumerate(nodes)}
+
+        # Every utility lies between the least and greatest reward forever
+        low = min(grid.rewards) / (1 - gamma)
+        high = max(grid.rewards) / (1 - gamma)
+        # Maps the point at each end of each stretch to the utilities, as
+        # (reward, U(a) coefficient, U(b) coefficient), of heading for b,
+        # heading for a, or heading for a point on the stretch and waiting
+        # there, and to the node indices of a and b
+        ends = {}
+        for a, cells, b in stretches:
+            if not cells:
+                continue
+            first, last, waiting = self.__eliminate(grid, gamma, a, cells, b)
+            # The same from b, swapping the coefficients back round
+            back_last, back_first, back_waiting = (
+                [(reward, to_a, to_b) for reward, to_b, to_a in options]
+                for options in self.__eliminate(
+                    grid, gamma, b, cells[::-1], a
+                )
+            )
+            ends[cells[0]] = (
+                self.__frontier(first + back_first + waiting, low, high),
+                index[a], index[b]
+            )
+            ends[cells[-1]] = (
+                self.__frontier(last + back_last + back_waiting, low, high),
+                index[a], index[b]
+            )
+        # Ends are numbered on from the nodes
+        for n, i in enumerate(ends, len(nodes)):
+            index[i] = n
+        self.__ends = ends.items()
+
+        self.__gamma = gamma
+        self.__nodes = nodes
+        self.__read = [grid.utilities[i] for i in nodes] + [0] * len(ends)
+        if self.__update == 'jacobi':
+            self.__write = self.__read[:]
+        else:
+            self.__write = self.__read
+        self.__points = [
+            (n, grid.rewards[i], [
+                [(index[j], probability) for j, probability in outcomes]
+                for outcomes in self.__model.transitions[i]
+            ])
+            for n, i in enumerate(nodes) if i not in grid.terminals
+        ]
+        self.size = len(nodes)
+
+    def __eliminate(self, grid, gamma, a, cells, b):
+        '''
+        Solves the Bellman equations of a stretch whose points all head from
+        node a towards node b, by Gaussian elimination of the tridiagonal
+        system, in terms of U(a) and U(b). Utilities are (reward, U(a)
+        coefficient, U(b) coefficient) triples.
+
+        Args:
+            grid (Grid): Grid representing the game state.
+            gamma (float): Discount factor.
+            a (int): Id of the node the stretch starts from.
+            cells (list): Ids of the corridor points, in order from a.
+            b (int): Id of the node the stretch leads to.
+
+        Returns:
+            Tuple of lists: the utility of the first point heading for b,
+            the same for the last point, and the utilities of the first point
+            heading for each point along the way and waiting there.
+        '''
+        transitions = self.__model.transitions
+        # U(c_i) = constant + coefficient * U(c_i+1), starting with U(a)
+        constant, coefficient = (0, 1, 0), 0
+        # U(c_1) = first + scale * U(c_i+1)
+        first, scale = None, None
+        waiting = []
+        for k, i in enumerate(cells):
+            previous = cells[k - 1] if k else a
+            following = cells[k + 1] if k + 1 < len(cells) else b
+            # Waiting on a point is worth its reward forever
+            stay = grid.rewards[i] / (1 - gamma)
+            if first is None:
+                waiting.append((stay, 0, 0))
+            else:
+                waiting.append((first[0] + scale * stay, first[1], first[2]))
+
+            for outcomes in transitions[i]:
+                # The first outcome is the intended one
+                if outcomes[0][0] == following:
+                    break
+            advance = back = still = 0
+            for j, probability in outcomes:
+                if j == following:
+                    advance += probability
+                elif j == previous:
+                    back += probability
+                else:
+                    still += probability
+            divisor = 1 - gamma * still - gamma * back * coefficient
+            constant = tuple(
+                (reward + gamma * back * c) / divisor
+                for reward, c in zip((grid.rewards[i], 0, 0), constant)
+            )
+            coefficient = gamma * advance / divisor
+            if first is None:
+                first, scale = constant, coefficient
+            else:
+                first = tuple(
+                    f + scale * c for f, c in zip(first, constant)
+                )
+                scale *= coefficient
+
+        # Heading on into b
+        first = (first[0], first[1], first[2] + scale)
+        last = (constant[0], constant[1], constant[2] + coefficient)
+
+        return [first], [last], waiting
+
+    @staticmethod
+    def __frontier(options, low, high):
+        '''
+        Args:
+            options (list): Utilities of the ways on from a point, as (reward,
+            U(a) coefficient, U(b) coefficient).
+            low (float): Lower bound on the utility of any point.
+            high (float): Upper bound on the utility of any point.
+
+        Returns:
+            The options that could be the best for some U(a) and U(b) between
+            low and high, by dropping any that another is no worse than
+            throughout.
+        '''
+        frontier = []
+        for option in sorted(options, reverse=True):
+            if not any(
+                other[0] - option[0] + sum(
+                    min((x - y) * low, (x - y) * high)
+                    for x, y in zip(other[1:], option[1:])
+                ) >= 0
+                for other in frontier
+            ):
+                frontier.append(option)
+        return frontier
+
+    def sweep(self):
+        '''
+        Evaluates the ends of every stretch, then performs one Bellman backup
+        of every node.
+
+        Returns:
+            Float representing the max-norm Bellman residual of the sweep.
+        '''
+        read, write = self.__read, self.__write
+        gamma = self.__gamma
+        residual = 0
+
+        for n, (_, end) in enumerate(self.__ends, len(self.__nodes)):
+            read[n] = self.__end(read, end)
+
+        backup = PointValueIteration.backup
+
+        for n, reward, outcomes in self.__points:
+            utility = backup(read, reward, outcomes, gamma)
+            difference = abs(utility - read[n])
+            if difference > residual:
+                residual = difference
+            write[n] = utility
+
+        self.__read, self.__write = write, read
+        return residual
+
+    @staticmethod
+    def __end(utilities, end):
+        '''
+        Args:
+            utilities (list): Utility of every node.
+            end (tuple): Options, and the indices of nodes a and b, of a
+            stretch end.
+
+        Returns:
+            Utility of the point at the end of a stretch, heading whichever
+            way is better.
+        '''
+        options, a, b = end
+        return max(
+            reward + to_a * utilities[a] + to_b * utilities[b]
+            for reward, to_a, to_b in options
+        )
+
+    def store(self, grid):
+        '''
+        Writes the utilities of the nodes, and of the points at the ends of
+        each stretch, back onto grid.
+
+        Args:
+            grid (Grid): Grid the utilities were loaded from.
+
+        Returns:
+            The same grid, with updated utility values.
+        '''
+        for i, utility in zip(self.__nodes, self.__read):
+            grid.utilities[i] = utility
+        for i, end in self.__ends:
+            grid.utilities[i] = self.__end(self.__read, end)
+
+        return grid
+
+
+class ValueCache(object):
+    '''
+    Least recently used cache of solved utility fields, keyed by board
+    signature. Each agent owns one for as long as it lives, so repeated
+    games with -n, and pacman coming back to a board he has already seen,
+    skip value iteration altogether.
+
+    At most size fields are held in memory. With a path, fields evicted from
+    memory are spilled to a shelve file there, and looked up again on a
+    memory miss, so the cache also carries over between runs.
+
+    Attributes:
+        hits (int): Number of lookups that found a field.
+        misses (int): Number of lookups that didn't.
+    '''
+
+    def __init__(self, size, path=None):
+        '''
+        Args:
+            size (int): Maximum number of fields held in memory.
+            path (str): Optional shelve file to spill evicted fields to.
+        '''
+        self.__size = size
+        # Fields from least to most recently used
+        self.__entries = OrderedDict()
+        self.__spill = shelve.open(path, protocol=2) if path else None
+        # Keys of the fields in memory that aren't in the spill file yet
+        self.__unspilled = set()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.__entries)
+
+    def get(self, key):
+        '''
+        Args:
+            key (tuple): Signature of the board.
+
+        Returns:
+            The field cached for key, marked as most recently used, or None.
+        '''
+        entry = self.__entries.pop(key, None)
+        if entry is None and self.__spill is not None:
+            entry = self.__spill.get(repr(key))
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        self.__entries[key] = entry
+        self.__evict()
+        return entry
+
+    def put(self, key, entry):
+        '''
+        Caches entry as the most recently used field, evicting the least
+        recently used ones over size.
+
+        Args:
+            key (tuple): Signature of the board.
+            entry: Field solved for the board.
+        '''
+        self.__entries.pop(key, None)
+        self.__entries[key] = entry
+        self.__unspilled.add(key)
+        self.__evict()
+
+    def sync(self):
+        '''
+        Writes every field in memory that isn't in the spill file yet to it.
+        '''
+        if self.__spill is None:
+            return
+        for key in self.__unspilled:
+            self.__spill[repr(key)] = self.__entries[key]
+        self.__unspilled.clear()
+        self.__spill.sync()
+
+    def __evict(self):
+        '''
+        Drops least recently used fields until at most size are in memory,
+        spilling any the spill file doesn't have yet.
+        '''
+        while len(self.__entries) > self.__size:
+            key, entry = self.__entries.popitem(last=False)
+            if key in self.__unspilled:
+                self.__unspilled.remove(key)
+                if self.__spill is not None:
+                    self.__spill[repr(key)] = entry
+
+
+class Telemetry(object):
+    '''
+    Sink of one JSON record per move, appended to a JSON lines file. Records
+    are held in memory, and only serialised and written once
+    Telemetry.BUFFER of them are pending or the game ends, so logging adds
+    no file IO to the moves themselves.
+
+    Attributes:
+        games (int): Number of games started with this sink.
+    '''
+
+    # Number of pending records that triggers a write
+    BUFFER = 1000
+
+    def __init__(self, path):
+        '''
+        Args:
+            path (str): JSON lines file to append records to.
+        '''
+        self.__path = path
+        self.__pending = []
+        self.games = 0
+
+    def record(self, record):
+        '''
+        Args:
+            record (dict): Fields of one move.
+        '''
+        self.__pending.append(record)
+        if len(self.__pending) >= Telemetry.BUFFER:
+            self.flush()
+
+    def flush(self):
+        '''
+        Writes every pending record to the file.
+        '''
+        if not self.__pending:
+            return
+        with open(self.__path, 'a') as sink:
+            sink.write(''.join(
+                json.dumps(record, sort_keys=True) + '\n'
+                for record in self.__pending
+            ))
+        del self.__pending[:]
+
+
+class Speculation(object):
+    '''
+    The board pacman expects to see on his next move: the food or capsule
+    on the point he intends to move to is eaten, and the ghosts are assumed
+    to stay where they are. It carries only flat arrays and its layout's
+    walls, so it pickles cheaply to a worker process, where speculate
+    solves it while the ghosts take their turns. The backends read it as
+    they would a Grid.
+
+    Attributes:
+        width (int): Width of the layout.
+        height (int): Height of the layout.
+        walls (frozenset): Coordinates of the layout's walls.
+        utilities (array): Utility of every point, indexed by cell id.
+        rewards (array): Expected reward of every point, indexed by cell id.
+        terminals (frozenset): Cell ids of the points whose utility is fixed
+        at their reward.
+        gamma (float): Expected discount factor.
+        residual (float): Final residual of the solve, once solved.
+    '''
+
+    def __init__(self, grid, i):
+        '''
+        Args:
+            grid (Grid): Solved grid of the current move.
+            i (int): Cell id of the point pacman intends to move to.
+        '''
+        context = grid.context
+        self.width = context.width
+        self.height = context.height
+        self.walls = context.walls
+        self.utilities = array('d', grid.utilities)
+        self.rewards = array('d', grid.rewards)
+        self.terminals = grid.terminals
+        self.residual = None
+        self.gamma = context.gamma
+
+        if i not in grid.terminals and Grid.DISPOSITIONS[
+            grid.dispositions[i]
+        ] in {Dispositions.FOOD, Dispositions.CAPSULE}:
+            self.rewards[i] = grid.eaten(i)
+            self.gamma = SolverContext.discount(context.fill_count - 1)
+
+    def solve(self, limit, threshold, update='jacobi'):
+        '''
+        Value iterates over the expected board with the python backend.
+
+        Args:
+            limit (int): Maximum number of sweeps.
+            threshold (float): Residual at or below which sweeping stops.
+            update (str): One of MDPAgent.UPDATES.
+
+        Returns:
+            The same speculation, with updated utility values.
+        '''
+        backend = PointValueIteration(
+            MotionModel.cached(self.width, self.height, self.walls), update
+        )
+        backend.load(self, self.gamma, None)
+        sweeps, residual = 0, float('inf')
+        while sweeps < limit and residual > threshold:
+            residual = backend.sweep()
+            sweeps += 1
+        backend.store(self)
+        self.residual = residual
+
+        return self
+
+
+def speculate(speculation, limit, threshold, update):
+    '''
+    Entry point of the worker process, which can only be handed a module
+    level function.
+
+    Returns:
+        Speculation.solve of the arguments.
+    '''
+    return speculation.solve(limit, threshold, update)
+
+
+@camel_case
+class MDPAgent(Agent):
+    '''
+    The MDPAgent the calculates the new utility values, using value interation
+    on every game step. In addition, pick the best next move dependent on the
+    resulting utility values.
+    '''
+
+    # Value iteration backends selectable with the 'solver' agent arg
+    SOLVERS = ('python', 'numpy', 'incremental', 'corridor', 'tiles')
+    # Stopping rules selectable with the 'convergence' agent arg
+    CONVERGENCE_MODES = ('fixed', 'residual', 'anytime')
+    # Update schemes selectable with the 'update' agent arg
+    UPDATES = ('jacobi', 'gauss_seidel')
+    # Gauss-Seidel sweep orders selectable with the 'order' agent arg
+    ORDERS = ('board', 'outward', 'inward')
+    # Ghost distance metrics selectable with the 'distance' agent arg
+    DISTANCES = ('manhattan', 'maze')
+    # Dispositions whose utility is fixed at their reward
+    TERMINAL_DISPOSITIONS = frozenset({
+        Dispositions.GHOST_HOSTILE, Dispositions.GHOST_NEIGHBOUR
+    })
+    # Share of the move budget 'anytime' may spend sweeping, leaving the rest
+    # for reading the board and choosing the move
+    BUDGET_SHARE = 0.9
+    # Largest magnitude a shaped reward can have, as f_phi and f_delta are at
+    # most e
+    MAX_REWARD = max(abs(reward) for reward in Point.REWARDS.values()) * e
+
+    def __init__(
+        self,
+        index=0,
+        solver='python',
+        convergence='fixed',
+        epsilon=0.01,
+        max_iterations=None,
+        warm_start=False,
+        update='jacobi',
+        order='board',
+        distance='manhattan',
+        window=None,
+        budget=None,
+        speculate=False,
+        cache=None,
+        cache_file=None,
+        workers=None,
+        telemetry=None,
+        report=False,
+    ):
+        '''
+        Agent args arrive from the command line as strings, so every numeric
+        or boolean argument is converted here.
+
+        Args:
+            index (int): Agent index, pacman is always 0.
+            solver (str): Value iteration backend, one of MDPAgent.SOLVERS.
+            'incremental' always warm starts and stops on the 'residual'
+            threshold, backing up only the points the board changes affect,
+            or sweeping the whole board when they are a large share of it.
+            'corridor' collapses corridors into edges between junctions and
+            only backs up the junctions. 'tiles' splits the board between
+            worker processes sharing the utilities in shared memory.
+            convergence (str): Stopping rule, one of
+            MDPAgent.CONVERGENCE_MODES. 'fixed' always runs
+            SolverContext.iteration_limit sweeps, 'residual' stops as soon as
+            the utilities are guaranteed to be within epsilon of optimal.
+            'anytime' stops like 'residual', or sooner once another sweep
+            would overrun the move's time budget.
+            epsilon (float): Maximum utility error tolerated by 'residual'
+            and 'anytime'.
+            max_iterations (int): Hard cap on sweeps per move for 'residual'
+            and 'anytime', defaults to ten times
+            SolverContext.iteration_limit.
+            warm_start (bool): Start each move's value iteration from the
+            utilities of the previous move, rather than from the rewards.
+            update (str): Update scheme, one of MDPAgent.UPDATES. 'jacobi'
+            computes every backup from the previous sweep's utilities,
+            'gauss_seidel' uses each new utility as soon as it is computed.
+            order (str): Order the python solver's Gauss-Seidel sweeps visit
+            points in, one of MDPAgent.ORDERS. 'outward' starts at pacman and
+            moves away in maze distance, 'inward' is the reverse. The numpy
+            solver always updates alternate points, like a chessboard.
+            distance (str): Metric used for ghost distances, one of
+            MDPAgent.DISTANCES. 'maze' looks up true path distances in a
+            table built per layout.
+            window (float): If given, only solve the points within a few
+            moves of pacman, enough that the utilities beyond them change
+            pacman's by at most this much. Not supported by the incremental,
+            corridor or tiles solvers.
+            budget (float): Seconds each move may take under 'anytime'.
+            Defaults to the game rules' move warning time, which the game
+            passes to set_move_budget.
+            speculate (bool): As soon as a move is chosen, solve the board
+            it is expected to lead to in a worker process, while the ghosts
+            move, and start the next move from that solution.
+            cache (int): If given, remember the solved utilities of up to
+            this many boards, across games, and reuse them whenever the same
+            board comes up again.
+            cache_file (str): Shelve file the cache spills evicted boards
+            to, and reads them back from, so they outlive the run.
+            workers (int): Number of worker processes of the tiles solver,
+            defaults to the number of CPUs.
+            telemetry (str): If given, append a JSON record of every move to
+            this file: the time spent building the grid, shaping rewards,
+            solving and choosing the move, the sweeps, final residual, open
+            cells and gamma, and the chosen and executed directions.
+            report (bool): Print sweep and residual statistics after each
+            game.
+        '''
+        Agent.__init__(self, index)
+        self.__solver = choice(solver, MDPAgent.SOLVERS, 'solver')
+        if self.__solver in ('numpy', 'tiles') and numpy is None:
+            raise ImportError('The %s solver requires NumPy' % self.__solver)
+        self.__convergence = choice(
+            convergence, MDPAgent.CONVERGENCE_MODES, 'convergence'
+        )
+        self.__epsilon = float(epsilon)
+        self.__max_iterations = max_iterations and int(max_iterations)
+        self.__warm_start = flag(warm_start)
+        self.__update = choice(update, MDPAgent.UPDATES, 'update')
+        self.__order = choice(order, MDPAgent.ORDERS, 'order')
+        self.__distance = choice(distance, MDPAgent.DISTANCES, 'distance')
+        self.__window = window and float(window)
+        if self.__window and \
+                self.__solver in ('incremental', 'corridor', 'tiles'):
+            raise ValueError(
+                'The %s solver does not support window' % self.__solver
+            )
+        if self.__solver == 'tiles' and self.__update != 'jacobi':
+            raise ValueError('The tiles solver only supports jacobi updates')
+        if workers and self.__solver != 'tiles':
+            raise ValueError('workers needs the tiles solver')
+        self.__workers = int(workers or cpu_count())
+        self.__budget = budget and float(budget)
+        if self.__budget and self.__convergence != 'anytime':
+            raise ValueError('budget needs anytime convergence')
+        # Move budget from the game rules, used if budget isn't given
+        self.__rules_budget = None
+        self.__speculate = flag(speculate)
+        if self.__speculate and self.__convergence == 'fixed' and \
+                self.__solver != 'incremental':
+            raise ValueError('speculate needs residual or anytime convergence')
+        # Worker process solving speculations, while a game is running
+        self.__pool = None
+        # (move number, pending result) of the last speculation started
+        self.__speculation = None
+        if cache_file and not cache:
+            raise ValueError('cache_file needs cache')
+        self.__value_cache = cache and ValueCache(int(cache), cache_file)
+        # Layout and settings of the current game, part of every cache key
+        self.__cache_tag = None
+        self.__telemetry = telemetry and Telemetry(telemetry)
+        # Number of the current game in the telemetry
+        self.__game = None
+        self.__report = flag(report)
+        self.__point_value_iteration = None
+        self.__array_value_iteration = None
+        self.__prioritized_sweeping = None
+        self.__corridor_value_iteration = None
+        self.__tile_value_iteration = None
+        self.__batch_value_iteration = None
+        # Layout and per turn parameters of the current game
+        self.__context = None
+        # Utility of every point at the end of the previous move, by cell id
+        self.__utilities = None
+        # (sweeps, final residual) of every move in the current game
+        self.history = []
+        # Number of points solved on every move in the current game, when
+        # fewer than the whole board
+        self.solved_sizes = []
+        # Seconds taken by every move in the current game, under 'anytime'
+        self.move_times = []
+        # Number of moves in the current game started from a speculation
+        self.speculated = 0
+        # Bellman backups performed, and seconds spent sweeping, in the
+        # current game
+        self.backups = 0
+        self.sweep_seconds = 0
+
+    def set_move_budget(self, seconds):
+        '''
+        Called by the game before it starts, with the time the rules allow
+        each move before warning the agent.
+
+        Args:
+            seconds (float): Move warning time of the game rules.
+        '''
+        self.__rules_budget = seconds
+
+    def register_initial_state(self, state):
+        '''
+        Builds this game's SolverContext, and the solver backend over the
+        motion model of its layout. Starts the worker process when
+        speculating.
+
+        Args:
+            state: Current game state.
+        '''
+        self.__context = SolverContext(state, self.__distance)
+        self.history = []
+        self.solved_sizes = []
+        self.move_times = []
+        self.speculated = 0
+        self.backups = 0
+        self.sweep_seconds = 0
+        self.__utilities = None
+        self.__speculation = None
+        if self.__speculate and self.__pool is None:
+            self.__pool = Pool(1)
+        if self.__telemetry is not None:
+            self.__telemetry.games += 1
+            self.__game = self.__telemetry.games
+        context = self.__context
+        # Spilled keys are looked up by repr, so the tag must be stable
+        # from run to run, which hash() is not
+        self.__cache_tag = md5(repr((
+            context.width, context.height, sorted(context.walls),
+            self.__solver, self.__convergence, self.__epsilon,
+            self.__max_iterations, self.__warm_start, self.__update,
+            self.__order, self.__distance, self.__window,
+        ))).hexdigest()
+
+        motion_model = self.__context.motion_model
+        if self.__batchable():
+            self.__batch_value_iteration = BatchValueIteration(motion_model)
+        if self.__solver == 'python':
+            self.__point_value_iteration = PointValueIteration(
+                motion_model, self.__update, self.__order
+            )
+        elif self.__solver == 'numpy':
+            self.__array_value_iteration = ArrayValueIteration(
+                motion_model, self.__update
+            )
+        elif self.__solver == 'incremental':
+            self.__prioritized_sweeping = PrioritizedSweeping(motion_model)
+        elif self.__solver == 'tiles':
+            self.__tile_value_iteration = TileValueIteration(
+                motion_model, self.__workers
+            )
+        else:
+            context = self.__context
+            self.__corridor_value_iteration = CorridorValueIteration(
+                CorridorGraph.cached(
+                    context.width, context.height, context.walls
+                ),
+                motion_model,
+                self.__update,
+            )
+
+    def get_action(self, state):
+        '''
+        Picks the best next move dependent on state.
+
+        Args:
+            state: Current game state.
+
+        Returns:
+            A direction representing where pacman should move next.
+        '''
+        started = time()
+        grid = Grid(state, self.__context)
+        pacman = grid.ids[Coordinate(*api.where_am_i(state))]
+
+        solving = time()
+        grid = self.__value_iteration(
+            grid, pacman, self.__deadline(started), self.__speculated()
+        )
+
+        choosing = time()
+        legal = api.legal_actions(state)
+
+        direction = self.__policy(grid, pacman, legal)
+        chosen = time()
+
+        if self.__speculate:
+            self.__start_speculation(grid, pacman, direction)
+
+        return self.__finish(
+            grid, legal, direction, time() - started, choosing - solving,
+            chosen - choosing,
+        )
+
+    @staticmethod
+    def get_actions(agents, states):
+        '''
+        Picks the next move of several agents, each playing its own game, at
+        once. The boards of the agents MDPAgent.__batchable allows, on the
+        same layout, are solved together by one BatchValueIteration, which
+        gives them the same utilities as solving each alone. Every other
+        agent picks its move with get_action.
+
+        Args:
+            agents (list): MDPAgents, each in its own game.
+            states (list): Current game state of each agent's game.
+
+        Returns:
+            List of the direction each agent should move in next.
+        '''
+        moves = [None] * len(agents)
+        batches = defaultdict(list)
+        for n, (agent, state) in enumerate(zip(agents, states)):
+            if agent.__batchable():
+                batches[agent.__context.motion_model].append(n)
+            else:
+                moves[n] = agent.get_action(state)
+
+        for members in batches.itervalues():
+            grids, pacmen, limits, thresholds = [], [], [], []
+            building = []
+            for n in members:
+                agent = agents[n]
+                started = time()
+                grid = Grid(states[n], agent.__context)
+                building.append(time() - started)
+                grids.append(grid)
+                pacmen.append(grid.ids[Coordinate(*api.where_am_i(states[n]))])
+                limit, threshold = agent.__stopping_rule()
+                limits.append(limit)
+                thresholds.append(threshold)
+
+            solving = time()
+            results = agents[members[0]].__batch_value_iteration.solve(
+                grids, [grid.context.gamma for grid in grids], limits,
+                thresholds,
+            )
+            # Each board is recorded with an equal share of the solve
+            solve_seconds = (time() - solving) / len(members)
+
+            for n, grid, pacman, result, built in zip(
+                members, grids, pacmen, results, building
+            ):
+                agent = agents[n]
+                sweeps, residual = result
+                agent.__account(sweeps, residual, grid.size(), solve_seconds)
+                choosing = time()
+                legal = api.legal_actions(states[n])
+                direction = agent.__policy(grid, pacman, legal)
+                chosen = time()
+                moves[n] = agent.__finish(
+                    grid, legal, direction,
+                    built + solve_seconds + chosen - choosing, solve_seconds,
+                    chosen - choosing,
+                )
+
+        return moves
+
+    def final(self, state):
+        '''
+        Called once the game is over. Stops any worker processes, and
+        prints the sweep and residual statistics of the game if reporting
+        was requested.
+
+        Args:
+            state: Final game state.
+        '''
+        if self.__pool is not None:
+            self.__pool.terminate()
+            self.__pool = None
+        if self.__tile_value_iteration is not None:
+            self.__tile_value_iteration.close()
+            self.__tile_value_iteration = None
+        if self.__value_cache is not None:
+            self.__value_cache.sync()
+        if self.__telemetry is not None:
+            self.__telemetry.flush()
+
+        if not self.__report or not self.history:
+            return
+
+        sweeps, residuals = zip(*self.history)
+        print 'Sweeps per move: mean %.1f, max %.1f' % (
+            float(sum(sweeps)) / len(sweeps), max(sweeps)
+        )
+        print 'Final residual:  mean %.3g, max %.3g' % (
+            sum(residuals) / len(residuals), max(residuals)
+        )
+        if self.solved_sizes:
+            print 'Solved points:   mean %.1f, max %d of %d' % (
+                float(sum(self.solved_sizes)) / len(self.solved_sizes),
+                max(self.solved_sizes), self.__context.size(),
+            )
+        if self.move_times:
+            print 'Move time:       mean %.1f ms, max %.1f ms of %s' % (
+                1000 * sum(self.move_times) / len(self.move_times),
+                1000 * max(self.move_times),
+                '%.1f ms' % (1000 * self.__move_budget())
+                if self.__move_budget() else 'no budget',
+            )
+        if self.__speculate:
+            print 'Speculation:     used on %d of %d moves' % (
+                self.speculated, len(self.history)
+            )
+        if self.sweep_seconds:
+            print 'Backups:         %.0f per second' % (
+                self.backups / self.sweep_seconds
+            )
+        if self.__value_cache is not None:
+            print 'Value cache:     %d hits, %d misses, %d boards held' % (
+                self.__value_cache.hits, self.__value_cache.misses,
+                len(self.__value_cache),
+            )
+
+    def __stopping_rule(self):
+        '''
+        Returns:
+            Tuple of the maximum number of sweeps for this move, and the
+            residual at or below which sweeping stops early.
+
+            For 'residual' and 'anytime', once a sweep changes no utility by
+            more than epsilon * (1 - gamma) / gamma, every utility is within
+            epsilon of its optimal value. The incremental solver always uses
+            this rule.
+        '''
+        if self.__convergence == 'fixed' and self.__solver != 'incremental':
+            return self.__context.iteration_limit, 0
+
+        gamma = self.__context.gamma
+        return (
+            self.__max_iterations or self.__context.iteration_limit * 10,
+            self.__epsilon * (1 - gamma) / gamma,
+        )
+
+    def __account(self, sweeps, residual, points, seconds):
+        '''
+        Records the solve of this move in the statistics of the game. Both
+        get_action and get_actions go through here, so the statistics are
+        the same however the moves were solved.
+
+        Args:
+            sweeps (int): Number of sweeps performed.
+            residual (float): Final residual.
+            points (int): Number of points each sweep backed up.
+            seconds (float): Time spent sweeping.
+        '''
+        self.sweep_seconds += seconds
+        self.backups += sweeps * points
+        self.history.append((sweeps, residual))
+
+    def __finish(
+        self, grid, legal, direction, move_seconds, solve_seconds,
+        policy_seconds,
+    ):
+        '''
+        Makes the move the policy chose, recording its time under 'anytime'
+        and the move in the telemetry.
+
+        Args:
+            grid (Grid): Solved grid of the move.
+            legal (list): Legal actions of pacman.
+            direction (str): Direction the policy chose.
+            move_seconds (float): Time spent on the whole move.
+            solve_seconds (float): Time spent in value iteration.
+            policy_seconds (float): Time spent choosing the direction.
+
+        Returns:
+            The direction pacman moves in, from api.make_move.
+        '''
+        if self.__convergence == 'anytime':
+            self.move_times.append(move_seconds)
+        move = api.make_move(direction, legal)
+        if self.__telemetry is not None:
+            self.__record(
+                grid, solve_seconds, policy_seconds, direction, move
+            )
+        return move
+
+    def __record(self, grid, solve_seconds, policy_seconds, chosen, move):
+        '''
+        Records the move just made in the telemetry.
+
+        Args:
+            grid (Grid): Solved grid of the move.
+            solve_seconds (float): Time spent in value iteration.
+            policy_seconds (float): Time spent choosing the direction.
+            chosen (str): Direction the policy chose.
+            move (str): Direction actually taken, after api.make_move.
+        '''
+        sweeps, residual = self.history[-1]
+        self.__telemetry.record({
+            'game': self.__game,
+            'move': len(self.history),
+            'grid_seconds': grid.build_seconds,
+            'shaping_seconds': grid.shaping_seconds,
+            'solve_seconds': solve_seconds,
+            'policy_seconds': policy_seconds,
+            'sweeps': sweeps,
+            # Infinite when no sweep ran, which JSON can't represent
+            'residual': residual if residual != float('inf') else None,
+            'open_cells': grid.size(),
+            'gamma': self.__context.gamma,
+            'chosen': chosen,
+            'executed': move,
+        })
+
+    def __batchable(self):
+        '''
+        Returns:
+            Bool that is true if get_actions can solve this agent's boards in
+            a batch: with the numpy solver, Jacobi updates, 'fixed' or
+            'residual' convergence, and none of the options that carry state
+            from one move to the next or solve part of the board.
+        '''
+        return (
+            numpy is not None and self.__solver == 'numpy' and
+            self.__update == 'jacobi' and
+            self.__convergence in ('fixed', 'residual') and
+            not (self.__window or self.__warm_start or self.__speculate) and
+            self.__value_cache is None
+        )
+
+    def __start_speculation(self, grid, pacman, direction):
+        '''
+        Hands the board the chosen move is expected to lead to to the worker
+        process, unless it is still busy with an earlier one.
+
+        Args:
+            grid (Grid): Solved grid of this move.
+            pacman (int): Cell id of pacman's position.
+            direction (str): Direction pacman intends to move in.
+        '''
+        if self.__speculation and not self.__speculation[1].ready():
+            return
+
+        model = self.__context.motion_model
+        limit, threshold = self.__stopping_rule()
+        self.__speculation = (len(self.history), self.__pool.apply_async(
+            speculate, (
+                Speculation(grid, model.steps[direction][pacman]),
+                limit, threshold, self.__update,
+            )
+        ))
+
+    def __speculated(self):
+        '''
+        Returns:
+            The speculation started at the end of the previous move, if the
+            worker has finished solving it, or None.
+        '''
+        if not self.__speculation:
+            return None
+        move, result = self.__speculation
+        if move != len(self.history) or not result.ready():
+            return None
+
+        self.__speculation = None
+        self.speculated += 1
+        return result.get()
+
+    def __move_budget(self):
+        '''
+        Returns:
+            Seconds each move may take, from the budget agent arg or else
+            the game rules, or None if neither is known.
+        '''
+        return self.__budget or self.__rules_budget
+
+    def __deadline(self, started):
+        '''
+        Args:
+            started (float): Time the move started.
+
+        Returns:
+            Time by which 'anytime' must stop sweeping, or None when there is
+            no deadline.
+        '''
+        if self.__convergence != 'anytime' or not self.__move_budget():
+            return None
+        return started + self.__move_budget() * MDPAgent.BUDGET_SHARE
+
+    def __window_radius(self, limit):
+        '''
+        The points pacman can move to are at least k - 1 moves from every
+        point k moves from pacman, so the utility of those points reaches his
+        moves discounted by at least gamma^(k - 1). No two utilities differ
+        by more than 2 * MDPAgent.MAX_REWARD / (1 - gamma), so holding every
+        point k moves away at any value within that range changes the
+        utilities of pacman's moves by at most the window tolerance once
+
+            gamma^(k - 1) * 2 * MAX_REWARD / (1 - gamma) <= window.
+
+        Under 'fixed' convergence with Jacobi updates a point's influence
+        only spreads one move per sweep, so a window limit + 2 moves across
+        gives exactly the utilities pacman chooses between that solving the
+        whole board would.
+
+        Args:
+            limit (int): Maximum number of sweeps for this move.
+
+        Returns:
+            Number of moves from pacman to the edge of the window, at least 2
+            so that pacman's moves are always solved.
+        '''
+        gamma = self.__context.gamma
+        radius = 1 + int(ceil(
+            log(self.__window * (1 - gamma) / (2 * MDPAgent.MAX_REWARD)) /
+            log(gamma)
+        ))
+        if self.__convergence == 'fixed' and self.__update == 'jacobi':
+            radius = min(radius, limit + 2)
+
+        return max(radius, 2)
+
+    def __value_iteration(
+        self, grid, pacman, deadline=None, speculation=None
+    ):
+        '''
+        Calculates and sets new utility values for every point on the grid,
+        sweeping until the stopping rule is met. Records the number of sweeps
+        and the final residual in self.history. For the incremental solver
+        the sweep count is the number of backups divided by the number of
+        points.
+
+        When warm starting, non-terminal points start from their utility at
+        the end of the previous move. Between two moves only pacman, the
+        ghosts and at most one food or capsule change, so that field is
+        already close to the new solution.
+
+        With a window tolerance, only the points within
+        MDPAgent.__window_radius moves of pacman are solved. The points on
+        the edge of the window keep their starting utility as a heuristic
+        value: their reward, or their utility from the previous move when
+        warm starting.
+
+        With a deadline, sweeping also stops once another sweep as long as
+        the last one would finish after it, keeping the utilities so far.
+
+        Given a speculation, non-terminal points start from its utilities
+        instead. The incremental solver takes it as its previous move, so it
+        only corrects the points where the ghosts, or pacman, didn't end up
+        where expected.
+
+        With a value cache, a board whose signature, and pacman's position,
+        match one already solved under the same layout and settings reuses
+        that board's utilities without sweeping at all.
+
+        Args:
+            grid (Grid): Grid representing the game state.
+            pacman (int): Cell id of pacman's position.
+            deadline (float): Time by which sweeping must stop, if any.
+            speculation (Speculation): Solved speculation of this move, if
+            any.
+
+        Returns:
+            The grid, containting updated utility values by performing value
+            iteration on each point.
+        '''
+        key = None
+        if self.__value_cache is not None:
+            key = (self.__cache_tag, pacman) + grid.signature
+            cached = self.__value_cache.get(key)
+            if cached is not None:
+                return self.__reuse(grid, cached)
+
+        start = self.__utilities if self.__warm_start else None
+        if speculation is not None:
+            start = speculation.utilities
+        if start is not None:
+            for i, utility in enumerate(start):
+                if i not in grid.terminals:
+                    grid.utilities[i] = utility
+
+        limit, threshold = self.__stopping_rule()
+        gamma = self.__context.gamma
+
+        if self.__solver == 'incremental':
+            if speculation is not None:
+                self.__prioritized_sweeping.adopt(
+                    speculation, speculation.gamma, speculation.residual
+                )
+            size = grid.size()
+            backups, residual = self.__prioritized_sweeping.solve(
+                grid, gamma, threshold, limit * size, deadline
+            )
+            self.history.append((float(backups) / size, residual))
+            self.__remember(key, grid, residual)
+            return grid
+
+        window = None
+        if self.__window:
+            window = self.__context.motion_model.window(
+                pacman, self.__window_radius(limit)
+            )
+            self.solved_sizes.append(len(window[0]))
+
+        if self.__solver == 'numpy':
+            backend = self.__array_value_iteration
+            backend.load(grid, gamma, window)
+        elif self.__solver == 'corridor':
+            backend = self.__corridor_value_iteration
+            backend.load(grid, gamma, pacman)
+            self.solved_sizes.append(backend.size)
+        elif self.__solver == 'tiles':
+            backend = self.__tile_value_iteration
+            backend.load(grid, gamma)
+        else:
+            backend = self.__point_value_iteration
+            backend.load(grid, gamma, pacman, window)
+
+        sweeps, residual = 0, float('inf')
+        started = now = time()
+        sweep_time = 0
+        while sweeps < limit and residual > threshold:
+            if deadline is not None and now + sweep_time > deadline:
+                break
+            residual = backend.sweep()
+            sweeps += 1
+            if deadline is not None:
+                now, sweep_time = time(), time() - now
+        self.__account(
+            sweeps, residual,
+            self.solved_sizes[-1] if window or self.__solver == 'corridor'
+            else grid.size(),
+            time() - started,
+        )
+
+        backend.store(grid)
+
+        if self.__warm_start:
+            self.__utilities = array('d', grid.utilities)
+        self.__remember(key, grid, residual)
+
+        return grid
+
+    def __remember(self, key, grid, residual):
+        '''
+        Puts the solved utilities of grid in the value cache, under key.
+
+        Args:
+            key (tuple): Cache key of the board, or None when not caching.
+            grid (Grid): Solved grid.
+            residual (float): Final residual of the solve.
+        '''
+        if key is not None:
+            self.__value_cache.put(key, (array('d', grid.utilities), residual))
+
+    def __reuse(self, grid, cached):
+        '''
+        Takes the utilities of grid from the value cache, as if they had
+        just been solved.
+
+        Args:
+            grid (Grid): Grid representing the game state.
+            cached (tuple): Utilities and final residual from the cache.
+
+        Returns:
+            The grid, with the cached utility values.
+        '''
+        utilities, residual = cached
+        grid.utilities[:] = utilities
+        self.history.append((0, residual))
+
+        if self.__warm_start:
+            self.__utilities = array('d', grid.utilities)
+        if self.__solver == 'incremental':
+            self.__prioritized_sweeping.adopt(
+                grid, self.__context.gamma, residual
+            )
+
+        return grid
+
+    def __policy(self, grid, pacman, legal):
+        '''
+        Finds the best policy from pacman's position, that's also included in
+        legal moves.
+
+        Args:
+            grid (Grid): Grid representing the game state.
+            pacman (int): Cell id of pacman's position.
+            legal (list): List of legal moves from current position
+
+        Returns:
+            Direction representing the optimum policy from pacman's position.
+        '''
+        return max(
+            (utility, direction)
+            for direction, utility in
+            self.__context.motion_model.expected_utilities(
+                grid.utilities, pacman
+            ).iteritems()
+            if direction in legal
+        )[1]
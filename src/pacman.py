@@ -41,6 +41,7 @@ The keys are 'a', 's', 'd', and 'w' to move (or arrow keys).  Have fun!
 """
 from game import GameStateData
 from game import Game
+from game import Configuration
 from game import Directions
 from game import Actions
 from util import nearestPoint
@@ -112,7 +113,7 @@ class GameState:
         if agentIndex == 0:
             state.data.scoreChange += -TIME_PENALTY # Penalty for waiting around
         else:
-            GhostRules.decrementTimer( state.data.agentStates[agentIndex] )
+            GhostRules.decrementTimer( state.data.writableAgentState( agentIndex ) )
 
         # Resolve multi-agent effects
         GhostRules.checkDeath( state, agentIndex )
@@ -146,11 +147,15 @@ class GameState:
         return self.data.agentStates[0].getPosition()
 
     def getGhostStates( self ):
+        if self.data.isolated:
+            return [self.data.writableAgentState( i ) for i in range( 1, self.getNumAgents() )]
         return self.data.agentStates[1:]
 
     def getGhostState( self, agentIndex ):
         if agentIndex == 0 or agentIndex >= self.getNumAgents():
             raise Exception("Invalid index passed to getGhostState")
+        if self.data.isolated:
+            return self.data.writableAgentState( agentIndex )
         return self.data.agentStates[agentIndex]
 
     def getGhostPosition( self, agentIndex ):
@@ -171,10 +176,20 @@ class GameState:
         """
         Returns a list of positions (x,y) of the remaining capsules.
         """
+        if self.data.isolated:
+            return self.data.writableCapsules()
         return self.data.capsules
 
     def getNumFood( self ):
-        return self.data.food.count()
+        return len( self.data.foodList() )
+
+    def getFoodList( self ):
+        """
+        Returns a tuple of the positions (x,y) of the remaining food, ordered
+        by x and then y. It is updated as food is eaten rather than read off
+        the food grid, so it costs nothing to ask for.
+        """
+        return self.data.foodList()
 
     def getFood(self):
         """
@@ -186,6 +201,8 @@ class GameState:
         currentFood = state.getFood()
         if currentFood[x][y] == True: ...
         """
+        if self.data.isolated:
+            return self.data.writableFood()
         return self.data.food
 
     def getWalls(self):
@@ -198,8 +215,17 @@ class GameState:
         walls = state.getWalls()
         if walls[x][y] == True: ...
         """
+        if self.data.isolated:
+            return self.data.writableLayout().walls
         return self.data.layout.walls
 
+    def getWallData(self):
+        """
+        Returns the layout's walls, open cells and corners, as a WallData
+        (see layout.py) computed once per layout.
+        """
+        return self.data.layout.getWallData()
+
     def hasFood(self, x, y):
         return self.data.food[x][y]
 
@@ -227,7 +253,7 @@ class GameState:
             self.data = GameStateData()
 
     def deepCopy( self ):
-        state = GameState( self )
+        state = GameState()
         state.data = self.data.deepCopy()
         return state
 
@@ -342,7 +368,7 @@ class PacmanRules:
         if action not in legal:
             raise Exception("Illegal action " + str(action))
 
-        pacmanState = state.data.agentStates[0]
+        pacmanState = state.data.writableAgentState( 0 )
 
         # Update Configuration
         vector = Actions.directionToVector( action, PacmanRules.PACMAN_SPEED )
@@ -361,21 +387,17 @@ class PacmanRules:
         # Eat food
         if state.data.food[x][y]:
             state.data.scoreChange += 10
-            state.data.food = state.data.food.copy()
-            state.data.food[x][y] = False
-            state.data._foodEaten = position
-            # TODO: cache numFood?
+            state.data.eatFood( position )
             numFood = state.getNumFood()
             if numFood == 0 and not state.data._lose:
                 state.data.scoreChange += 500
                 state.data._win = True
         # Eat capsule
         if( position in state.getCapsules() ):
-            state.data.capsules.remove( position )
-            state.data._capsuleEaten = position
+            state.data.eatCapsule( position )
             # Reset all ghosts' scared timers
             for index in range( 1, len( state.data.agentStates ) ):
-                state.data.agentStates[index].scaredTimer = SCARED_TIME
+                state.data.writableAgentState( index ).scaredTimer = SCARED_TIME
     consume = staticmethod( consume )
 
 class GhostRules:
@@ -404,7 +426,7 @@ class GhostRules:
         if action not in legal:
             raise Exception("Illegal ghost action " + str(action))
 
-        ghostState = state.data.agentStates[ghostIndex]
+        ghostState = state.data.writableAgentState( ghostIndex )
         speed = GhostRules.GHOST_SPEED
         if ghostState.scaredTimer > 0: speed /= 2.0
         vector = Actions.directionToVector( action, speed )
@@ -414,7 +436,9 @@ class GhostRules:
     def decrementTimer( ghostState):
         timer = ghostState.scaredTimer
         if timer == 1:
-            ghostState.configuration.pos = nearestPoint( ghostState.configuration.pos )
+            # Configurations are shared between states, so replace it
+            configuration = ghostState.configuration
+            ghostState.configuration = Configuration( nearestPoint( configuration.pos ), configuration.direction )
         ghostState.scaredTimer = max( 0, timer - 1 )
     decrementTimer = staticmethod( decrementTimer )
 
@@ -425,12 +449,12 @@ class GhostRules:
                 ghostState = state.data.agentStates[index]
                 ghostPosition = ghostState.configuration.getPosition()
                 if GhostRules.canKill( pacmanPosition, ghostPosition ):
-                    GhostRules.collide( state, ghostState, index )
+                    GhostRules.collide( state, state.data.writableAgentState( index ), index )
         else:
             ghostState = state.data.agentStates[agentIndex]
             ghostPosition = ghostState.configuration.getPosition()
             if GhostRules.canKill( pacmanPosition, ghostPosition ):
-                GhostRules.collide( state, ghostState, agentIndex )
+                GhostRules.collide( state, state.data.writableAgentState( agentIndex ), agentIndex )
     checkDeath = staticmethod( checkDeath )
 
     def collide( state, ghostState, agentIndex):
@@ -523,6 +547,8 @@ def readCommand( argv ):
                       help='Turns on exception handling and timeouts during games', default=False)
     parser.add_option('--timeout', dest='timeout', type='int',
                       help=default('Maximum length of time an agent can spend computing in a single game'), default=30)
+    parser.add_option('--lockstep', dest='lockstep', type='int',
+                      help=default('Number of games to play side by side, for agents that can pick moves for several games at once'), default=1)
 
     options, otherjunk = parser.parse_args(argv)
     if len(otherjunk) != 0:
@@ -570,6 +596,10 @@ def readCommand( argv ):
     args['record'] = options.record
     args['catchExceptions'] = options.catchExceptions
     args['timeout'] = options.timeout
+    if options.lockstep > 1:
+        if options.record or options.catchExceptions:
+            raise Exception('--lockstep cannot be used with -r or -c')
+        args['lockstep'] = options.lockstep
 
     # Special case: recorded games don't use the runGames method or args structure
     if options.gameToReplay != None:
@@ -626,13 +656,17 @@ def replayGame( layout, actions, display ):
     display.finish()
 
 @util.timer(False)
-def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30 ):
+def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0, catchExceptions=False, timeout=30, lockstep=1 ):
     import __main__
     __main__.__dict__['_display'] = display
 
     rules = ClassicGameRules(timeout)
     games = []
 
+    if lockstep > 1 and 'getActions' in dir(pacman):
+        games = runLockstep( rules, layout, pacman, ghosts, numGames, numTraining, lockstep )
+        numGames = 0
+
     for i in range( numGames ):
         beQuiet = i < numTraining
         if beQuiet:
@@ -655,7 +689,7 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
             cPickle.dump(components, f)
             f.close()
 
-    if (numGames-numTraining) > 0:
+    if games:
         scores = [game.state.getScore() for game in games]
         wins = [game.state.isWin() for game in games]
         winRate = wins.count(True)/ float(len(wins))
@@ -666,6 +700,42 @@ def runGames( layout, pacman, ghosts, display, numGames, record, numTraining = 0
 
     return games
 
+def runLockstep( rules, layout, pacman, ghosts, numGames, numTraining, lockstep ):
+    """
+    Plays the games in groups of lockstep games side by side, each with its
+    own copy of the pacman agent and no graphics. Every turn, pacman's moves
+    in all the unfinished games of a group are picked with one call to its
+    getActions. Returns the games that were not training.
+    """
+    import copy, textDisplay
+    games = []
+    for first in range( 0, numGames, lockstep ):
+        group = []
+        for i in range( first, min( first + lockstep, numGames ) ):
+            beQuiet = i < numTraining
+            game = rules.newGame( layout, copy.copy( pacman ), ghosts, textDisplay.NullGraphics(), beQuiet )
+            game.start()
+            group.append( ( game, beQuiet ) )
+
+        playing = group
+        while playing:
+            actions = pacman.getActions( [ game.agents[0] for game, beQuiet in playing ],
+                                         [ game.state.deepCopy() for game, beQuiet in playing ] )
+            for ( game, beQuiet ), action in zip( playing, actions ):
+                # The rules print the result of a game unless it is quiet
+                rules.quiet = beQuiet
+                game.play( 0, action )
+                for agentIndex in range( 1, len( game.agents ) ):
+                    if game.gameOver: break
+                    agent = game.agents[agentIndex]
+                    game.play( agentIndex, agent.getAction( game.state.deepCopy() ) )
+            playing = [ ( game, beQuiet ) for game, beQuiet in playing if not game.gameOver ]
+
+        for game, beQuiet in group:
+            game.finish()
+            if not beQuiet: games.append( game )
+    return games
+
 if __name__ == '__main__':
     """
     The main function called when pacman.py is run
@@ -0,0 +1,89 @@
+# testGameState.py
+# ----------------
+# Checks that the copies of a GameState given to agents are isolated from
+# the state they were copied from, although they share its parts until one
+# of them is changed.
+#
+# Run from this directory with: python -m unittest testGameState
+
+import unittest
+import layout
+from pacman import GameState
+from game import Directions
+
+
+class TestDeepCopyIsolation(unittest.TestCase):
+
+    def setUp(self):
+        self.state = GameState()
+        self.state.initialize(layout.getLayout('mediumClassic'), 2)
+        self.copy = self.state.deepCopy()
+
+    def assertUnchanged(self, before):
+        self.assertEqual(before, self.snapshot())
+
+    def snapshot(self):
+        s = self.state
+        return (
+            str(s.getFood()), s.getNumFood(), s.getFoodList(),
+            list(s.getCapsules()), str(s.getWalls()),
+            [(g.scaredTimer, g.configuration) for g in s.getGhostStates()],
+            s.getPacmanState().configuration,
+        )
+
+    def testFood(self):
+        before = self.snapshot()
+        x, y = self.state.getFoodList()[0]
+        food = self.copy.getFood()
+        food[x][y] = False
+        self.assertUnchanged(before)
+        # The copy sees its own change
+        self.assertEqual(self.copy.getNumFood(), self.state.getNumFood() - 1)
+        self.assertFalse((x, y) in self.copy.getFoodList())
+
+    def testFoodInSuccessors(self):
+        before = self.snapshot()
+        successor = self.copy.generateSuccessor(0, Directions.STOP)
+        successor.getFood()[1][1] = True
+        self.copy.getFood()[1][2] = True
+        self.assertUnchanged(before)
+        self.assertTrue((1, 2) in self.copy.getFoodList())
+
+    def testCapsules(self):
+        before = self.snapshot()
+        self.copy.getCapsules().pop()
+        self.assertUnchanged(before)
+        self.assertEqual(len(self.copy.getCapsules()),
+                         len(self.state.getCapsules()) - 1)
+
+    def testGhostStates(self):
+        before = self.snapshot()
+        self.copy.getGhostState(1).scaredTimer = 40
+        for ghostState in self.copy.getGhostStates():
+            ghostState.scaredTimer = 40
+        self.copy.getPacmanState().scaredTimer = 40
+        self.assertUnchanged(before)
+        self.assertEqual(self.copy.getGhostState(2).scaredTimer, 40)
+
+    def testWalls(self):
+        before = self.snapshot()
+        self.copy.getWalls()[1][1] = True
+        self.assertUnchanged(before)
+        self.assertFalse(self.state.hasWall(1, 1))
+        self.assertTrue(self.copy.hasWall(1, 1))
+        self.assertFalse((1, 1) in self.state.getWallData().walls)
+        self.assertTrue((1, 1) in self.copy.getWallData().walls)
+
+    def testEngineWrites(self):
+        # The engine changing the original leaves the copy as it was
+        before = str(self.copy.getFood()), list(self.copy.getCapsules())
+        successor = self.state
+        for action in ['West', 'West', 'West']:
+            successor = successor.generateSuccessor(0, action)
+        self.assertTrue(successor.getNumFood() < self.state.getNumFood())
+        self.assertEqual(before, (str(self.copy.getFood()),
+                                  list(self.copy.getCapsules())))
+
+
+if __name__ == '__main__':
+    unittest.main()